@@ -1,2 +1,3 @@
 from . import controllers
-from . import models 
\ No newline at end of file
+from . import models
+from .hooks import post_init_hook 
\ No newline at end of file
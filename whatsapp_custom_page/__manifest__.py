@@ -1,6 +1,6 @@
 {
     'name': 'WhatsApp Custom Page',
-    'version': '1.9',
+    'version': '1.13',
     'category': 'Productivity/Communications',
     'summary': 'Custom WhatsApp Chat Interface',
     'author': "Mustafa Elsergany | Awtad Tech",
@@ -8,14 +8,19 @@
     'description': """
         this module provides a custom WhatsApp chat interface for odoo.
     """,
-    'depends': ['base', 'web', 'mail', 'whatsapp'],
+    'depends': ['base', 'web', 'bus', 'mail', 'whatsapp'],
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
         'views/whatsapp_page_menus.xml',
         'views/whatsapp_page_templates.xml',
     ],
     'assets': {
         'web.assets_backend': [
+            'whatsapp_custom_page/static/src/js/virtual_window.js',
+            'whatsapp_custom_page/static/src/js/conversation_store.js',
+            'whatsapp_custom_page/static/src/js/tab_coordinator.js',
+            'whatsapp_custom_page/static/src/js/poll_scheduler.js',
             'whatsapp_custom_page/static/src/js/whatsapp_chat.js',
             'whatsapp_custom_page/static/src/css/whatsapp_chat.scss',
             'whatsapp_custom_page/static/src/xml/whatsapp_chat.xml',
@@ -26,6 +31,7 @@
     },
     'icon': '/whatsapp_custom_page/static/description/icon.png',
     'web_icon': '/whatsapp_custom_page/static/description/icon.png',
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'application': True,
     'auto_install': False,
@@ -1,17 +1,24 @@
-from odoo import http, _
+from odoo import fields, http, _
 from odoo.http import request
 from odoo.exceptions import AccessError, UserError
 from odoo.tools import html2plaintext
 from odoo.osv import expression
 from werkzeug.exceptions import NotFound
+from ..models.mail_message import WHATSAPP_STATUS_MAPPING, SEARCH_RESULT_LIMIT
+from ..models.ir_attachment import UPLOAD_CHUNK_SIZE
 import json
 import re
 from datetime import datetime, timedelta
 import logging
 import base64
+import io
 
 _logger = logging.getLogger(__name__)
 
+# transactions commit out of id and write_date order, so each sync also looks
+# again at what was written this long before the previous one; only rows of
+# transactions running longer than that can still be missed
+SYNC_OVERLAP = timedelta(seconds=60)
 
 class WhatsAppController(http.Controller):
     @http.route('/whatsapp/chat', type='http', auth='user')
@@ -42,30 +49,99 @@ class WhatsAppController(http.Controller):
                 'error': str(e)
             })
 
+    def _get_conversation_domain(self):
+        """Domain of the WhatsApp channels visible to the current user"""
+        return [
+            ('channel_type', '=', 'whatsapp'),
+            '|',
+            ('channel_member_ids.partner_id', '=', request.env.user.partner_id.id),
+            ('create_uid', '=', request.env.uid),
+        ]
+
+    def _format_conversations(self, channels, search_term=None):
+        """Build the conversation list entries of the given channels"""
+        # the last message summary is stored on the channel itself
+        channels.read([
+            'name', 'create_date', 'whatsapp_partner_id', 'whatsapp_last_message_id',
+            'whatsapp_last_message_body', 'whatsapp_last_message_date',
+            'whatsapp_last_message_author_id', 'whatsapp_last_message_status',
+        ])
+        window_state = request.env['discuss.channel'].sudo()._whatsapp_get_window_state(channels.ids)
+        
+        # get all channel members in one query
+        channel_members = request.env['discuss.channel.member'].sudo().search_read(
+            [
+                ('channel_id', 'in', channels.ids),
+                ('partner_id', '=', request.env.user.partner_id.id)
+            ],
+            ['channel_id', 'seen_message_id', 'message_unread_counter']
+        )
+        member_dict = {m['channel_id'][0]: m for m in channel_members}
+        
+        conversations = []
+        
+        for channel in channels:
+            if not channel.whatsapp_last_message_id and not search_term:  # Skip if no message unless searching
+                continue
+            
+            # get channel member for unread count
+            channel_member = member_dict.get(channel.id)
+            unread_count = channel_member.get('message_unread_counter', 0) if channel_member else 0
+            
+            # determine message direction from the current user point of view
+            author = channel.whatsapp_last_message_author_id
+            is_outbound = bool(author) and author == request.env.user.partner_id
+            
+            phone = channel.whatsapp_phone or channel.name
+            
+            conversations.append({
+                'id': channel.id,
+                'phone': phone,
+                'partner_name': channel.whatsapp_partner_id.name if channel.whatsapp_partner_id else phone,
+                'partner_id': channel.whatsapp_partner_id.id if channel.whatsapp_partner_id else False,
+                'last_message_id': channel.whatsapp_last_message_id.id or False,
+                'last_message': channel.whatsapp_last_message_body or '',
+                'last_message_date': channel.whatsapp_last_message_date or channel.create_date,
+                'unread_count': unread_count,
+                'status': channel.whatsapp_last_message_status or None,
+                'direction': 'outbound' if is_outbound else 'inbound',
+                'is_sent': is_outbound,
+                'last_message_author_id': author.id or None,
+                'window_open': window_state.get(channel.id, (False, None))[0],
+                'window_expiry': window_state.get(channel.id, (False, None))[1] or False,
+            })
+        
+        return conversations
+
     @http.route('/whatsapp/conversations', type='json', auth='user')
     def get_conversations(self, offset=0, limit=20, search_term=None, **kwargs):
         try:
             DiscussChannel = request.env['discuss.channel'].sudo()
             
             # base domain
-            domain = [
-                ('channel_type', '=', 'whatsapp'),
-                '|',
-                ('channel_member_ids.partner_id', '=', request.env.user.partner_id.id),
-                ('create_uid', '=', request.env.uid),
-            ]
+            domain = self._get_conversation_domain()
+            if not search_term:
+                # conversations without any message are only listed when searching
+                domain = expression.AND([domain, [('whatsapp_last_message_id', '!=', False)]])
             
             # add search conditions if search term is provided
             if search_term:
                 search_term = search_term.strip()
-                # search in channel name (phone number) and partner name
+                # search message content through the trigram index, scoped to the visible channels
+                # each conversation once, so that a busy one does not push the others out
+                matching_ids = request.env['mail.message'].sudo()._whatsapp_search_channels(
+                    search_term, DiscussChannel.search(domain).ids,
+                )
+                # search in phone number, partner name and message content
                 domain = expression.AND([
                     domain,
-                    ['|', '|',
-                        ('name', 'ilike', search_term),  # search in phone number
-                        ('whatsapp_partner_id.name', 'ilike', search_term),  # search in partner name
-                        ('message_ids.body', 'ilike', search_term),  # search in message content
-                    ]
+                    expression.OR([
+                        DiscussChannel._whatsapp_phone_search_domain(search_term),
+                        # channels are named '<phone> - <name>', also when no partner is linked
+                        [('name', 'ilike', search_term)],
+                        [('whatsapp_partner_id.name', 'ilike', search_term)],
+                        [('id', 'in', matching_ids)],
+                    ])
                 ])
             
             # get total count for pagination
@@ -76,103 +152,10 @@ class WhatsAppController(http.Controller):
                 domain,
                 offset=offset,
                 limit=limit,
-                order='write_date desc, id desc'
-            )
-            
-            # optimize by fetching all related data in bulk
-            channel_ids = channels.ids
-            message_domain = [
-                ('model', '=', 'discuss.channel'),
-                ('res_id', 'in', channel_ids),
-                '|',
-                ('message_type', 'in', ['whatsapp_message', 'whatsapp']),
-                ('is_whatsapp', '=', True),
-            ]
-            
-            # if searching in messages add message content to domain
-            if search_term:
-                message_domain = expression.OR([
-                    message_domain,
-                    [('body', 'ilike', search_term)]
-                ])
-            
-            messages = request.env['mail.message'].sudo().search_read(
-                message_domain,
-                ['res_id', 'body', 'create_date', 'message_type', 'author_id', 'whatsapp_status', 'id', 'official_whatsapp_message_id'],
-                order='create_date desc'
-            )
-            
-            # create message lookup dict for O(1) access
-            latest_messages = {}
-            for msg in messages:
-                if msg['res_id'] not in latest_messages:
-                    latest_messages[msg['res_id']] = msg
-            
-            # get all channel members in one query
-            channel_members = request.env['discuss.channel.member'].sudo().search_read(
-                [
-                    ('channel_id', 'in', channel_ids),
-                    ('partner_id', '=', request.env.user.partner_id.id)
-                ],
-                ['channel_id', 'seen_message_id', 'message_unread_counter']
+                order='whatsapp_last_message_date desc nulls last, id desc'
             )
-            member_dict = {m['channel_id'][0]: m for m in channel_members}
-            
-            conversations = []
-            WhatsAppMessage = request.env['whatsapp.message'].sudo()
             
-            for channel in channels:
-                # get the latest message for the channel
-                latest_message = latest_messages.get(channel.id)
-                if not latest_message and not search_term:  # Skip if no message unless searching
-                    continue
-                
-                # get channel member for unread count
-                channel_member = member_dict.get(channel.id)
-                unread_count = channel_member.get('message_unread_counter', 0) if channel_member else 0
-                
-                # clean message body from html tags
-                message_body = latest_message.get('body', '') if latest_message else ''
-                if message_body:
-                    try:
-                        message_body = html2plaintext(message_body)
-                    except Exception:
-                        message_body = re.sub(r'<[^>]*>', '', message_body).strip()
-                
-                # determine message direction and status
-                is_outbound = latest_message and latest_message.get('author_id') and latest_message['author_id'][0] == request.env.user.partner_id.id
-                
-                # get status from official message if it exists
-                status = latest_message.get('whatsapp_status', 'sent') if latest_message else None
-                if latest_message and latest_message.get('official_whatsapp_message_id'):
-                    official_msg = WhatsAppMessage.browse(latest_message['official_whatsapp_message_id'][0])
-                    if official_msg.exists():
-                        status_mapping = {
-                            'sent': 'sent',
-                            'delivered': 'delivered',
-                            'read': 'read',
-                            'error': 'failed'
-                        }
-                        status = status_mapping.get(official_msg.state, status)
-                
-                # format phone number for display
-                phone = channel.name
-                if ' - ' in phone:
-                    phone = phone.split(' - ')[0]
-                
-                conversations.append({
-                    'id': channel.id,
-                    'phone': phone,
-                    'partner_name': channel.whatsapp_partner_id.name if channel.whatsapp_partner_id else phone,
-                    'partner_id': channel.whatsapp_partner_id.id if channel.whatsapp_partner_id else False,
-                    'last_message': message_body,
-                    'last_message_date': latest_message['create_date'] if latest_message else channel.create_date,
-                    'unread_count': unread_count,
-                    'status': status,
-                    'direction': 'outbound' if is_outbound else 'inbound',
-                    'is_sent': is_outbound,
-                    'last_message_author_id': latest_message.get('author_id') and latest_message['author_id'][0] if latest_message else None,
-                })
+            conversations = self._format_conversations(channels, search_term=search_term)
             
             return {
                 'conversations': conversations,
@@ -186,7 +169,13 @@ class WhatsAppController(http.Controller):
             return {'error': str(e)}
 
     @http.route('/whatsapp/messages', type='json', auth='user')
-    def get_messages(self, channel_id, offset=0, limit=50, **kwargs):
+    def get_messages(self, channel_id, offset=0, limit=50, before_id=None, after_id=None, with_count=True, **kwargs):
+        """Return a page of messages of a WhatsApp channel, newest first.
+
+        ``before_id`` / ``after_id`` select the page by message id (keyset
+        pagination on the (model, res_id, id) index) and take precedence over
+        ``offset``. The total count is only computed when ``with_count`` is set.
+        """
         try:
             if not channel_id:
                 return {'error': _('Channel ID is required')}
@@ -197,24 +186,39 @@ class WhatsAppController(http.Controller):
             if not channel.exists() or channel.channel_type != 'whatsapp':
                 return {'error': _('WhatsApp channel not found')}
             
-            # get total count for pagination
-            domain = [
-                ('model', '=', 'discuss.channel'),
-                ('res_id', '=', channel.id),
-                '|',
-                ('message_type', 'in', ['whatsapp_message', 'whatsapp']),
-                ('is_whatsapp', '=', True),
-            ]
-            
-            total_count = request.env['mail.message'].sudo().search_count(domain)
+            MailMessage = request.env['mail.message'].sudo()
+            domain = MailMessage._whatsapp_get_channel_domain(channel.id)
             
-            # get messages with pagination order by id desc to show newest first
-            messages = request.env['mail.message'].sudo().search(
-                domain,
-                offset=offset,
-                limit=limit,
-                order='id desc'
-            )
+            # get total count for pagination
+            total_count = MailMessage.search_count(domain) if with_count else None
+            
+            # one extra row tells whether more messages are left in that direction
+            if after_id:
+                messages = MailMessage.search(
+                    expression.AND([domain, [('id', '>', int(after_id))]]),
+                    limit=limit + 1,
+                    order='id asc'
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit].sorted('id', reverse=True)
+            elif before_id:
+                messages = MailMessage.search(
+                    expression.AND([domain, [('id', '<', int(before_id))]]),
+                    limit=limit + 1,
+                    order='id desc'
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                # get messages with pagination order by id desc to show newest first
+                messages = MailMessage.search(
+                    domain,
+                    offset=offset,
+                    limit=limit + 1,
+                    order='id desc'
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
             
             # fetch related records
             messages.mapped('author_id')
@@ -226,67 +230,211 @@ class WhatsAppController(http.Controller):
                 lambda m: m.partner_id == request.env.user.partner_id
             )
             
-            result = []
-            WhatsAppMessage = request.env['whatsapp.message'].sudo()
-            
-            for message in messages:
-                is_outbound = message.author_id == request.env.user.partner_id
-                
-                # get status from official message if it exists
-                status = message.whatsapp_status
-                if message.official_whatsapp_message_id:
-                    official_msg = message.official_whatsapp_message_id
-                    if official_msg.exists():
-                        status_mapping = {
-                            'sent': 'sent',
-                            'delivered': 'delivered',
-                            'read': 'read',
-                            'error': 'failed'
-                        }
-                        status = status_mapping.get(official_msg.state, 'failed')
-                
-                attachments = [{
-                    'id': attachment.id,
-                    'name': attachment.name,
-                    'filename': attachment.name,
-                    'url': f'/web/content/{attachment.id}?download=true',
-                    'mimetype': attachment.mimetype,
-                } for attachment in message.attachment_ids]
-                
-                result.append({
-                    'id': message.id,
-                    'body': message.body or '',
-                    'author_name': message.author_id.name if message.author_id else _('Unknown'),
-                    'author_id': message.author_id.id if message.author_id else False,
-                    'direction': 'outbound' if is_outbound else 'inbound',
-                    'create_date': message.create_date,
-                    'date': message.date,
-                    'status': status,
-                    'attachment_ids': attachments,
-                    'is_sent': is_outbound,
-                    'whatsapp_message_id': message.whatsapp_message_id,
-                    'official_whatsapp_message_id': message.official_whatsapp_message_id.id if message.official_whatsapp_message_id else False,
-                    'error_message': message.error_message if hasattr(message, 'error_message') else None,
-                })
+            result = messages._whatsapp_format_messages()
             
-            # mark messages as read only if loading the first page
-            if offset == 0 and messages and channel_member:
+            # mark messages as read only if loading the newest messages, and
+            # only write the marker when it actually moves forward
+            is_latest_page = not before_id and (after_id or offset == 0)
+            channel_member = channel_member.filtered(
+                lambda m: messages and m.seen_message_id.id < messages[0].id
+            )
+            if is_latest_page and messages and channel_member:
                 channel_member.write({
                     'seen_message_id': messages[0].id,
                     'fetched_message_id': messages[0].id,
                     'message_unread_counter': 0,  # reset unread counter
                 })
+                channel._whatsapp_notify_unread(request.env.user.partner_id, 0)
             
             return {
                 'messages': result,
                 'total_count': total_count,
                 'offset': offset,
                 'limit': limit,
+                'has_more': has_more,
+                'oldest_id': messages[-1].id if messages else False,
+                'newest_id': messages[0].id if messages else False,
             }
         except Exception as e:
             _logger.error("Error fetching WhatsApp messages: %s", str(e))
             return {'error': str(e)}
 
+    @http.route('/whatsapp/search', type='json', auth='user')
+    def search_messages(self, term, channel_id=None, limit=SEARCH_RESULT_LIMIT, **kwargs):
+        try:
+            term = (term or '').strip()
+            DiscussChannel = request.env['discuss.channel'].sudo()
+            
+            # only search the conversations the user can see
+            domain = self._get_conversation_domain()
+            if channel_id:
+                domain = expression.AND([domain, [('id', '=', int(channel_id))]])
+            channel_ids = DiscussChannel.search(domain).ids
+            
+            MailMessage = request.env['mail.message'].sudo()
+            matches = MailMessage._whatsapp_search_messages(term, channel_ids, limit=limit)
+            messages = MailMessage.browse([message_id for message_id, _channel_id, _rank in matches])
+            messages.mapped('author_id')
+            
+            results = []
+            for message, (_message_id, match_channel_id, rank) in zip(messages, matches):
+                results.append({
+                    'message_id': message.id,
+                    'channel_id': match_channel_id,
+                    'snippet': message._whatsapp_search_snippet(term),
+                    'rank': rank,
+                    'author_name': message.author_id.name if message.author_id else _('Unknown'),
+                    'create_date': message.create_date,
+                })
+            
+            return {
+                'results': results,
+                'term': term,
+                'limit': min(int(limit), SEARCH_RESULT_LIMIT),
+            }
+        except Exception as e:
+            _logger.error("Error searching WhatsApp messages: %s", str(e))
+            return {'error': str(e)}
+
+    def _get_poll_interval_hint(self):
+        """Minimum delay before the next poll, in milliseconds.
+
+        Set ``whatsapp_custom_page.poll_interval`` (seconds) to slow every
+        client down, e.g. during an incident; 0 lets clients decide.
+        """
+        seconds = request.env['ir.config_parameter'].sudo().get_param('whatsapp_custom_page.poll_interval', 0)
+        try:
+            return max(int(float(seconds) * 1000), 0) or False
+        except ValueError:
+            return False
+
+    @http.route('/whatsapp/sync', type='json', auth='user')
+    def sync(self, cursor=None, limit=200, **kwargs):
+        """Return what changed since ``cursor`` together with the next cursor.
+
+        The cursor holds the highest ``mail.message`` id and the latest
+        ``whatsapp.message`` (write_date, id) pair the client has seen, and
+        the time of the sync. Rows written up to ``SYNC_OVERLAP`` before that
+        time are sent again, so that the ones committed late are not lost;
+        the client skips what it already has. Without a cursor only the
+        current one is returned so the client can start syncing from there.
+        """
+        try:
+            sync_time = fields.Datetime.now()
+            MailMessage = request.env['mail.message'].sudo()
+            DiscussChannel = request.env['discuss.channel'].sudo()
+            cr = request.env.cr
+            limit = min(int(limit), 500)
+
+            if not cursor:
+                last_message = MailMessage.search([], order='id desc', limit=1)
+                cr.execute("""
+                    SELECT write_date, id FROM whatsapp_message
+                     WHERE write_date IS NOT NULL
+                  ORDER BY write_date DESC, id DESC
+                     LIMIT 1
+                """)
+                row = cr.fetchone()
+                return {
+                    'cursor': {
+                        'message_id': last_message.id or 0,
+                        'status_date': row[0].isoformat(' ') if row else False,
+                        'status_id': row[1] if row else 0,
+                        'time': fields.Datetime.to_string(sync_time),
+                    },
+                    'conversations': [],
+                    'messages': [],
+                    'statuses': [],
+                    'has_more': False,
+                    'poll_interval': self._get_poll_interval_hint(),
+                }
+
+            last_message_id = int(cursor.get('message_id') or 0)
+            status_date = cursor.get('status_date') or '1970-01-01 00:00:00'
+            status_id = int(cursor.get('status_id') or 0)
+            since = (fields.Datetime.to_datetime(cursor.get('time')) or sync_time) - SYNC_OVERLAP
+
+            # only the conversations of the caller, filtered before any limit
+            visible_ids = DiscussChannel.search(self._get_conversation_domain()).ids
+            message_domain = [
+                ('model', '=', 'discuss.channel'),
+                ('res_id', 'in', visible_ids),
+                '|',
+                ('message_type', 'in', ['whatsapp_message', 'whatsapp']),
+                ('is_whatsapp', '=', True),
+            ]
+
+            # new messages, oldest first so the next cursor never skips any
+            messages = MailMessage.search(
+                expression.AND([message_domain, [('id', '>', last_message_id)]]),
+                order='id asc', limit=limit,
+            )
+            # messages below the cursor that were committed after the previous sync
+            late_messages = MailMessage.search(
+                expression.AND([message_domain, [('id', '<=', last_message_id), ('create_date', '>=', since)]]),
+                order='id asc', limit=limit,
+            )
+
+            # status transitions, compared at full timestamp precision
+            status_query = """
+                SELECT wm.write_date, wm.id, wm.state, mm.id, mm.res_id
+                  FROM whatsapp_message wm
+                  JOIN mail_message mm ON mm.id = wm.mail_message_id
+                 WHERE {}
+                   AND mm.model = 'discuss.channel'
+                   AND mm.res_id = ANY(%s)
+              ORDER BY wm.write_date, wm.id
+                 LIMIT %s
+            """
+            cr.execute(status_query.format("(wm.write_date, wm.id) > (%s, %s)"),
+                       [status_date, status_id, visible_ids, limit])
+            status_rows = cr.fetchall()
+            cr.execute(status_query.format("(wm.write_date, wm.id) <= (%s, %s) AND wm.write_date >= %s"),
+                       [status_date, status_id, since, visible_ids, limit])
+            late_status_rows = cr.fetchall()
+
+            channel_ids = set((messages | late_messages).mapped('res_id'))
+            channel_ids.update(row[4] for row in status_rows + late_status_rows)
+            channels = DiscussChannel.browse()
+            if channel_ids:
+                channels = DiscussChannel.search(
+                    [('id', 'in', list(channel_ids))],
+                    order='whatsapp_last_message_date desc nulls last, id desc',
+                )
+
+            # new messages already carry their status
+            statuses = [{
+                'channel_id': res_id,
+                'message_id': message_id,
+                'status': WHATSAPP_STATUS_MAPPING.get(state, 'failed'),
+            } for _date, _id, state, message_id, res_id in late_status_rows + status_rows
+                if message_id <= last_message_id]
+
+            new_messages = late_messages | messages
+            formatted_messages = []
+            for message, values in zip(new_messages, new_messages._whatsapp_format_messages()):
+                values['channel_id'] = message.res_id
+                formatted_messages.append(values)
+
+            next_cursor = {
+                'message_id': messages[-1].id if messages else last_message_id,
+                'status_date': status_rows[-1][0].isoformat(' ') if status_rows else cursor.get('status_date'),
+                'status_id': status_rows[-1][1] if status_rows else status_id,
+                'time': fields.Datetime.to_string(sync_time),
+            }
+
+            return {
+                'cursor': next_cursor,
+                'conversations': self._format_conversations(channels) if channels else [],
+                'messages': formatted_messages,
+                'statuses': statuses,
+                'has_more': len(messages) >= limit or len(status_rows) >= limit,
+                'poll_interval': self._get_poll_interval_hint(),
+            }
+        except Exception as e:
+            _logger.error("Error syncing WhatsApp conversations: %s", str(e))
+            return {'error': str(e)}
+
     @http.route('/whatsapp/send', type='json', auth='user')
     def send_message(self, channel_id, message, attachment_ids=None):
         try:
@@ -315,14 +463,13 @@ class WhatsAppController(http.Controller):
             
             new_message = request.env['mail.message'].sudo().create(message_vals)
             
-            # extract phone number from channel name
-            phone = channel.name.split(' - ')[0] if ' - ' in channel.name else channel.name
-            phone = ''.join(filter(str.isdigit, phone))
+            # normalized phone stored on the channel
+            phone = channel.whatsapp_phone
             if phone:
                 new_message.write({'whatsapp_phone': phone})
                 
-                # get wa account
-                wa_account = request.env['whatsapp.account'].sudo().search([('active', '=', True)], limit=1)
+                # account the conversation is pinned to, or routed on its first message
+                wa_account = channel._whatsapp_get_account()
                 if wa_account:
                     # create message in official wa module
                     WhatsAppMessage = request.env['whatsapp.message'].sudo()
@@ -345,16 +492,7 @@ class WhatsAppController(http.Controller):
                             'official_whatsapp_message_id': official_message.id,
                             'whatsapp_status': 'sent'
                         })
-                        
-                        # trigger the send method from the official module
-                        try:
-                            official_message._send_message(with_commit=True)
-                        except Exception as e:
-                            _logger.error("Error sending message through official module: %s", str(e))
-                            # try using cron job as fallback
-                            cron_job = request.env.ref('whatsapp.ir_cron_send_whatsapp_queue')
-                            if cron_job:
-                                cron_job.sudo()._trigger()
+                        # the send queue worker picks it up, see _process_send_queue
             
             # notify channel
             channel._notify_thread(new_message)
@@ -369,18 +507,47 @@ class WhatsAppController(http.Controller):
                     'direction': 'outbound',
                     'create_date': new_message.create_date,
                     'status': 'sent',
-                    'attachment_ids': [{
-                        'id': att.id,
-                        'name': att.name,
-                        'url': f'/web/content/{att.id}?download=true',
-                        'mimetype': att.mimetype,
-                    } for att in new_message.attachment_ids] if new_message.attachment_ids else [],
+                    'attachment_ids': new_message.attachment_ids._whatsapp_format_attachments(),
                 }
             }
         except Exception as e:
             _logger.error("Error sending WhatsApp message: %s", str(e))
             return {'error': str(e)}
 
+    @http.route('/whatsapp/send_bulk', type='json', auth='user')
+    def send_bulk(self, channel_ids=None, phones=None, message=None, template_id=None, **kwargs):
+        try:
+            if not (channel_ids or phones) or not (message or template_id):
+                return {'error': _('Channels or phone numbers and a message or template are required')}
+            
+            DiscussChannel = request.env['discuss.channel'].sudo()
+            
+            # only the conversations visible to the current user
+            visible_domain = self._get_conversation_domain()
+            channels = DiscussChannel._whatsapp_find_channels(phones or [], visible_domain)
+            if channel_ids:
+                channels |= DiscussChannel.search(expression.AND([
+                    visible_domain, [('id', 'in', [int(channel_id) for channel_id in channel_ids])],
+                ]))
+            
+            if not channels:
+                return {'error': _('No WhatsApp channel found')}
+            
+            template = request.env['whatsapp.template'].sudo().browse(int(template_id)) if template_id else None
+            if template is not None and not template.exists():
+                return {'error': _('WhatsApp template not found')}
+            
+            messages = channels._whatsapp_send_bulk(body=message, template=template)
+            
+            return {
+                'success': True,
+                'count': len(messages),
+                'message_ids': messages.ids,
+            }
+        except Exception as e:
+            _logger.error("Error sending bulk WhatsApp messages: %s", str(e))
+            return {'error': str(e)}
+
     @http.route('/whatsapp/mark_as_read', type='json', auth='user')
     def mark_messages_as_read(self, channel_id, **kwargs):
         try:
@@ -408,19 +575,18 @@ class WhatsAppController(http.Controller):
                 return json.dumps({'error': 'WhatsApp channel not found'})
 
             attachment_ids = []
-            for file in files:
-                data = file.read()
-                filename = file.filename
-                mimetype = file.content_type
-
-                attachment = request.env['ir.attachment'].sudo().create({
-                    'name': filename,
-                    'datas': base64.b64encode(data),
+            for index, file in enumerate(files):
+                # streamed to the filestore, never read as a whole
+                attachment = request.env['ir.attachment'].sudo()._whatsapp_create_from_stream(file.stream, {
+                    'name': file.filename,
                     'res_model': 'discuss.channel',
                     'res_id': channel.id,
-                    'type': 'binary',
-                    'mimetype': mimetype,
+                    'mimetype': file.content_type,
                 })
+                # poster frame of videos, generated by the browser
+                thumbnail = request.httprequest.files.get(f'thumbnail_{index}')
+                if thumbnail and not attachment.whatsapp_thumbnail_id:
+                    attachment._whatsapp_set_thumbnail(thumbnail.stream)
                 attachment_ids.append(attachment.id)
 
             # create message with attachments
@@ -450,12 +616,7 @@ class WhatsAppController(http.Controller):
                     'direction': 'outbound',
                     'create_date': message.create_date,
                     'status': 'sent',
-                    'attachment_ids': [{
-                        'id': att.id,
-                        'name': att.name,
-                        'url': f'/web/content/{att.id}?download=true',
-                        'mimetype': att.mimetype,
-                    } for att in message.attachment_ids],
+                    'attachment_ids': message.attachment_ids._whatsapp_format_attachments(),
                 }
             })
         except Exception as e:
@@ -476,16 +637,13 @@ class WhatsAppController(http.Controller):
                 return json.dumps({'error': 'WhatsApp channel not found'})
 
             audio_file = request.httprequest.files['audio']
-            data = audio_file.read()
             filename = 'voice_message.webm'
 
             # create attachment
-            attachment = request.env['ir.attachment'].sudo().create({
+            attachment = request.env['ir.attachment'].sudo()._whatsapp_create_from_stream(audio_file.stream, {
                 'name': filename,
-                'datas': base64.b64encode(data),
                 'res_model': 'discuss.channel',
                 'res_id': channel.id,
-                'type': 'binary',
                 'mimetype': 'audio/webm',
             })
 
@@ -516,14 +674,104 @@ class WhatsAppController(http.Controller):
                     'direction': 'outbound',
                     'create_date': create_date,
                     'status': 'sent',
-                    'attachment_ids': [{
-                        'id': attachment.id,
-                        'name': filename,
-                        'url': f'/web/content/{attachment.id}?download=true',
-                        'mimetype': 'audio/webm',
-                    }],
+                    'attachment_ids': attachment._whatsapp_format_attachments(),
                 }
             })
         except Exception as e:
             _logger.error("Error uploading voice message: %s", str(e))
-            return json.dumps({'error': str(e)}) 
\ No newline at end of file
+            return json.dumps({'error': str(e)}) 
+
+    def _get_upload_channel(self, channel_id):
+        channel = request.env['discuss.channel'].browse(int(channel_id)).exists()
+        if not channel or channel.channel_type != 'whatsapp':
+            raise NotFound()
+        return channel.sudo()
+
+    @http.route('/whatsapp/upload/start', type='json', auth='user')
+    def upload_start(self, channel_id, filename, mimetype, size, **kwargs):
+        """Open a resumable chunked upload for a large media file"""
+        channel = self._get_upload_channel(channel_id)
+        Attachment = request.env['ir.attachment'].sudo()
+        upload_id = Attachment._whatsapp_upload_start(
+            'discuss.channel', channel.id, filename, mimetype or 'application/octet-stream', size)
+        return {
+            'upload_id': upload_id,
+            'offset': 0,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+        }
+
+    @http.route('/whatsapp/upload/status', type='json', auth='user')
+    def upload_status(self, upload_id, **kwargs):
+        """Offset to resume an interrupted chunked upload from"""
+        info = request.env['ir.attachment'].sudo()._whatsapp_upload_info(upload_id)
+        return {
+            'upload_id': upload_id,
+            'offset': info['offset'],
+            'size': info['size'],
+        }
+
+    @http.route('/whatsapp/upload/chunk', type='http', auth='user', methods=['POST'], csrf=False)
+    def upload_chunk(self, upload_id, offset, **post):
+        try:
+            chunk = request.httprequest.files.get('chunk')
+            if not chunk:
+                return json.dumps({'error': 'No chunk uploaded'})
+            offset = request.env['ir.attachment'].sudo()._whatsapp_upload_chunk(upload_id, offset, chunk.stream)
+            return json.dumps({'success': True, 'offset': offset})
+        except Exception as e:
+            _logger.error("Error uploading chunk: %s", str(e))
+            return json.dumps({'error': str(e)})
+
+    @http.route('/whatsapp/upload/finish', type='json', auth='user')
+    def upload_finish(self, upload_id, thumbnail=None, **kwargs):
+        """Create the attachment and its message once all chunks are received.
+
+        ``thumbnail`` is the small base64 JPEG poster of a video, if any.
+        """
+        Attachment = request.env['ir.attachment'].sudo()
+        info = Attachment._whatsapp_upload_info(upload_id)
+        channel = self._get_upload_channel(info['res_id'])
+        attachment = Attachment._whatsapp_upload_finish(upload_id)
+        if thumbnail and not attachment.whatsapp_thumbnail_id:
+            attachment._whatsapp_set_thumbnail(io.BytesIO(base64.b64decode(thumbnail)))
+
+        if attachment.mimetype.startswith('audio/'):
+            message_body = '🎤 Voice message'
+        else:
+            message_type = 'image' if attachment.mimetype.startswith('image/') else 'file'
+            message_body = f'📎 {message_type.capitalize()} attachment'
+
+        message = request.env['mail.message'].sudo().create({
+            'body': message_body,
+            'message_type': 'whatsapp_message',
+            'model': 'discuss.channel',
+            'res_id': channel.id,
+            'author_id': request.env.user.partner_id.id,
+            'subtype_id': request.env.ref('mail.mt_comment').id,
+            'attachment_ids': [(6, 0, attachment.ids)],
+        })
+
+        # notify channel
+        channel._notify_thread(message)
+
+        return {
+            'success': True,
+            'message': {
+                'id': message.id,
+                'body': message_body,
+                'author_name': request.env.user.name,
+                'author_id': request.env.user.partner_id.id,
+                'direction': 'outbound',
+                'create_date': message.create_date,
+                'status': 'sent',
+                'attachment_ids': attachment._whatsapp_format_attachments(),
+            }
+        }
+
+    @http.route('/whatsapp/upload/abort', type='json', auth='user')
+    def upload_abort(self, upload_id, **kwargs):
+        Attachment = request.env['ir.attachment'].sudo()
+        # only the owner of the upload may drop it
+        Attachment._whatsapp_upload_info(upload_id)
+        Attachment._whatsapp_upload_abort(upload_id)
+        return {'success': True}
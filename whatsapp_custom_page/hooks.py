@@ -0,0 +1,6 @@
+def post_init_hook(env):
+    # fill the last message summary of the conversations that already exist
+    channels = env['discuss.channel'].sudo().search([('channel_type', '=', 'whatsapp')])
+    channels._whatsapp_recompute_last_message()
+    channels._whatsapp_recompute_last_inbound()
+    channels._whatsapp_recompute_phone()
@@ -0,0 +1,4 @@
+def migrate(cr, version):
+    # create the stored phone column up front, so that the ORM does not
+    # compute it record by record; post-migrate fills it with SQL
+    cr.execute("ALTER TABLE discuss_channel ADD COLUMN IF NOT EXISTS whatsapp_phone varchar")
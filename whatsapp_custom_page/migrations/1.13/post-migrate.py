@@ -0,0 +1,8 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # the normalized phone now comes from whatsapp_number, not the channel name
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    channels = env['discuss.channel'].search([('channel_type', '=', 'whatsapp')])
+    channels._whatsapp_recompute_phone()
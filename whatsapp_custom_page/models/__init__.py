@@ -1 +1,6 @@
-from . import mail_message 
\ No newline at end of file
+from . import mail_message
+from . import discuss_channel
+from . import ir_attachment
+from . import whatsapp_media_cache
+from . import whatsapp_resolver
+from . import whatsapp_account
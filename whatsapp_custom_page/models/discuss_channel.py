@@ -0,0 +1,444 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.osv import expression
+from odoo.tools import html2plaintext
+from odoo.tools.sql import create_index
+from datetime import timedelta
+import json
+import logging
+import re
+
+_logger = logging.getLogger(__name__)
+
+# number of characters of the last message kept for the conversation list
+PREVIEW_LENGTH = 256
+# free form messages are only allowed this long after the customer wrote
+SESSION_WINDOW = timedelta(hours=24)
+
+# SQL twin of whatsapp_normalize_phone
+PHONE_SQL = "NULLIF('+' || regexp_replace(regexp_replace({}, '\\D', '', 'g'), '^00', ''), '+')"
+
+def whatsapp_normalize_phone(number):
+    """E.164 form of a phone number: '+' followed by its digits, or False"""
+    digits = re.sub(r'\D', '', number or '')
+    # international call prefix
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return f'+{digits}' if digits else False
+
+class DiscussChannel(models.Model):
+    _inherit = 'discuss.channel'
+
+    # summary of the latest WhatsApp message, kept up to date by mail.message
+    whatsapp_last_message_id = fields.Many2one('mail.message', string='Last WhatsApp Message', index='btree_not_null')
+    whatsapp_last_message_body = fields.Char('Last WhatsApp Message Preview')
+    whatsapp_last_message_date = fields.Datetime('Last WhatsApp Message Date', index=True)
+    whatsapp_last_message_author_id = fields.Many2one('res.partner', string='Last WhatsApp Message Author')
+    whatsapp_last_message_direction = fields.Selection([
+        ('outbound', 'Outbound'),
+        ('inbound', 'Inbound')
+    ], string='Last WhatsApp Message Direction')
+    whatsapp_last_message_status = fields.Selection([
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('read', 'Read'),
+        ('failed', 'Failed')
+    ], string='Last WhatsApp Message Status')
+
+    # 24 hours customer service window, kept up to date by mail.message
+    whatsapp_last_inbound_date = fields.Datetime('Last WhatsApp Inbound Date')
+    whatsapp_window_expiry = fields.Datetime('WhatsApp Session Window Expiry', index='btree_not_null')
+    # phone of the customer in E.164 form, from the number of the whatsapp module
+    whatsapp_phone = fields.Char('WhatsApp Phone', compute='_compute_whatsapp_phone', store=True)
+
+    def init(self):
+        super().init()
+        # channel lookup of the whatsapp module when a customer message comes in
+        create_index(
+            self._cr, 'discuss_channel_whatsapp_number_index', self._table,
+            ['whatsapp_number', 'wa_account_id'], where="channel_type = 'whatsapp'",
+        )
+        # exact and prefix lookups of a phone number
+        create_index(
+            self._cr, 'discuss_channel_whatsapp_phone_index', self._table,
+            ['whatsapp_phone varchar_pattern_ops'], where="whatsapp_phone IS NOT NULL",
+        )
+        # searches by any part of the phone or of the channel name
+        if self.env.registry.has_trigram:
+            create_index(
+                self._cr, 'discuss_channel_whatsapp_phone_trgm_index', self._table,
+                ['whatsapp_phone gin_trgm_ops'], method='gin', where="whatsapp_phone IS NOT NULL",
+            )
+            create_index(
+                self._cr, 'discuss_channel_whatsapp_name_trgm_index', self._table,
+                ['name gin_trgm_ops'], method='gin', where="channel_type = 'whatsapp'",
+            )
+
+    @api.depends('whatsapp_number', 'channel_type')
+    def _compute_whatsapp_phone(self):
+        for channel in self:
+            if channel.channel_type == 'whatsapp':
+                channel.whatsapp_phone = whatsapp_normalize_phone(channel.whatsapp_number)
+            else:
+                channel.whatsapp_phone = False
+
+    def _whatsapp_recompute_phone(self):
+        """Fill the normalized phone of these channels and of their messages"""
+        if not self:
+            return
+        self.flush_model(['whatsapp_number', 'channel_type'])
+        self.env['mail.message'].flush_model(['whatsapp_phone'])
+        self.env.cr.execute(f"""
+            UPDATE discuss_channel
+               SET whatsapp_phone = {PHONE_SQL.format('whatsapp_number')}
+             WHERE id = ANY(%s)
+               AND channel_type = 'whatsapp'
+        """, [self.ids])
+        # earlier messages stored the bare digits
+        self.env.cr.execute(f"""
+            UPDATE mail_message
+               SET whatsapp_phone = {PHONE_SQL.format('whatsapp_phone')}
+             WHERE model = 'discuss.channel'
+               AND res_id = ANY(%s)
+               AND whatsapp_phone IS NOT NULL
+               AND whatsapp_phone NOT LIKE '+%%'
+        """, [self.ids])
+        self.invalidate_recordset(['whatsapp_phone'])
+        self.env['mail.message'].invalidate_model(['whatsapp_phone'])
+
+    @api.model
+    def _whatsapp_find_channels(self, phones, domain=None):
+        """WhatsApp channels of the given phone numbers, written in any
+        format, among the channels matching ``domain``"""
+        normalized = {whatsapp_normalize_phone(str(phone)) for phone in phones} - {False}
+        if not normalized:
+            return self.browse()
+        return self.search(expression.AND([
+            domain or [],
+            [('channel_type', '=', 'whatsapp'), ('whatsapp_phone', 'in', list(normalized))],
+        ]))
+
+    @api.model
+    def _whatsapp_phone_search_domain(self, term):
+        """Domain matching the channels whose phone contains ``term``, e.g.
+        its last digits.
+
+        Matches nothing when ``term`` does not look like a phone number.
+        """
+        if not re.fullmatch(r'[\d\s()+.-]+', term or ''):
+            return expression.FALSE_DOMAIN
+        # the digits as typed: leading zeros are part of the searched digits,
+        # not an international prefix
+        digits = re.sub(r'\D', '', term)
+        if len(digits) < 3:
+            return expression.FALSE_DOMAIN
+        # contains match on the digits, served by the trigram index
+        return [('whatsapp_phone', 'like', digits)]
+
+    def _whatsapp_is_inbound(self, message):
+        """Whether the message was written by the customer of this channel"""
+        self.ensure_one()
+        if self.whatsapp_partner_id:
+            return message.author_id == self.whatsapp_partner_id
+        return not message.author_id.user_ids
+
+    def _whatsapp_last_message_values(self, message, status=None):
+        """Summary values describing ``message`` as the last one of the channel"""
+        self.ensure_one()
+        preview = message.body or ''
+        if preview:
+            try:
+                preview = html2plaintext(preview)
+            except Exception:
+                preview = re.sub(r'<[^>]*>', '', preview).strip()
+        return {
+            'whatsapp_last_message_id': message.id,
+            'whatsapp_last_message_body': preview[:PREVIEW_LENGTH],
+            'whatsapp_last_message_date': message.create_date,
+            'whatsapp_last_message_author_id': message.author_id.id,
+            'whatsapp_last_message_direction': 'inbound' if self._whatsapp_is_inbound(message) else 'outbound',
+            'whatsapp_last_message_status': status or message._whatsapp_get_status(),
+        }
+
+    def _whatsapp_update_last_message(self, messages, status_map=None):
+        """Make the newest of ``messages`` the last message of each channel,
+        unless a newer one is already there; one write per channel"""
+        if status_map is None:
+            status_map = messages._whatsapp_get_status_map()
+        latest = {}
+        for message in messages:
+            current = latest.get(message.res_id)
+            if current is None or message.id > current.id:
+                latest[message.res_id] = message
+        for channel in self:
+            message = latest.get(channel.id)
+            if not message:
+                continue
+            if channel.whatsapp_last_message_id.id and channel.whatsapp_last_message_id.id > message.id:
+                continue
+            channel.write(channel._whatsapp_last_message_values(message, status_map.get(message.id)))
+
+    def _whatsapp_recompute_last_message(self):
+        """Rebuild the last message summary from mail.message"""
+        MailMessage = self.env['mail.message'].sudo()
+        last_message_ids = MailMessage._whatsapp_get_last_message_ids(self.ids)
+        for channel in self:
+            message = MailMessage.browse(last_message_ids.get(channel.id))
+            if message:
+                channel.write(channel._whatsapp_last_message_values(message))
+            elif channel.whatsapp_last_message_id:
+                channel.write({
+                    'whatsapp_last_message_id': False,
+                    'whatsapp_last_message_body': False,
+                    'whatsapp_last_message_date': False,
+                    'whatsapp_last_message_author_id': False,
+                    'whatsapp_last_message_direction': False,
+                    'whatsapp_last_message_status': False,
+                })
+
+    def _whatsapp_update_last_inbound(self, messages):
+        """Open the session window of each channel from the newest of
+        ``messages`` written by its customer; one write per channel"""
+        latest = {}
+        for message in messages:
+            current = latest.get(message.res_id)
+            if current is None or message.create_date > current.create_date:
+                if self.browse(message.res_id)._whatsapp_is_inbound(message):
+                    latest[message.res_id] = message
+        for channel in self:
+            message = latest.get(channel.id)
+            if not message:
+                continue
+            if channel.whatsapp_last_inbound_date and channel.whatsapp_last_inbound_date >= message.create_date:
+                continue
+            channel.write({
+                'whatsapp_last_inbound_date': message.create_date,
+                'whatsapp_window_expiry': message.create_date + SESSION_WINDOW,
+            })
+
+    def _whatsapp_recompute_last_inbound(self):
+        """Rebuild the session window from the latest inbound message of each channel"""
+        if not self:
+            return
+        self.env['mail.message'].flush_model()
+        self.flush_model(['whatsapp_partner_id'])
+        self.env.cr.execute("""
+            UPDATE discuss_channel c
+               SET whatsapp_last_inbound_date = inbound.create_date,
+                   whatsapp_window_expiry = inbound.create_date + %s
+              FROM (
+                    SELECT c2.id, (
+                        SELECT max(m.create_date)
+                          FROM mail_message m
+                         WHERE m.model = 'discuss.channel'
+                           AND m.res_id = c2.id
+                           AND m.message_type IN ('whatsapp_message', 'whatsapp')
+                           -- same rule as _whatsapp_is_inbound
+                           AND CASE WHEN c2.whatsapp_partner_id IS NOT NULL
+                                    THEN m.author_id = c2.whatsapp_partner_id
+                                    ELSE NOT EXISTS (SELECT 1 FROM res_users u
+                                                      WHERE u.partner_id = m.author_id AND u.active)
+                               END
+                    ) AS create_date
+                      FROM discuss_channel c2
+                     WHERE c2.id = ANY(%s)
+                   ) inbound
+             WHERE c.id = inbound.id
+        """, [SESSION_WINDOW, self.ids])
+        self.invalidate_recordset(['whatsapp_last_inbound_date', 'whatsapp_window_expiry'])
+
+    def _whatsapp_window_open(self):
+        """Whether a free form message can be sent to the customer now"""
+        self.ensure_one()
+        return bool(self.whatsapp_window_expiry and self.whatsapp_window_expiry > fields.Datetime.now())
+
+    @api.model
+    def _whatsapp_get_window_state(self, channel_ids):
+        """Session window expiry of many channels at once.
+
+        :return: {channel_id: (is_open, expiry)}, channels never written to
+            by the customer are closed with no expiry
+        """
+        if not channel_ids:
+            return {}
+        self.flush_model(['whatsapp_window_expiry'])
+        self.env.cr.execute("""
+            SELECT id, whatsapp_window_expiry, coalesce(whatsapp_window_expiry > now() at time zone 'UTC', false)
+              FROM discuss_channel
+             WHERE id = ANY(%s)
+        """, [list(channel_ids)])
+        return {channel_id: (is_open, expiry) for channel_id, expiry, is_open in self.env.cr.fetchall()}
+
+    def _whatsapp_get_accounts(self):
+        """Map each channel id to the account its conversation is sent from.
+
+        A conversation stays on the account that owns it. Channels without
+        one, or whose account was archived, are routed to an active account
+        and pinned to it, with one write per account.
+        """
+        WhatsAppAccount = self.env['whatsapp.account']
+        active_ids = {account_id for account_id, _weight, _limit in WhatsAppAccount._whatsapp_get_routing_table()}
+        accounts = {}
+        to_pin = {}
+        for channel in self.sudo():
+            account = channel.wa_account_id
+            if account.id not in active_ids:
+                account = WhatsAppAccount._whatsapp_route()
+                if account:
+                    to_pin.setdefault(account, []).append(channel.id)
+            accounts[channel.id] = account
+        for account, channel_ids in to_pin.items():
+            self.sudo().browse(channel_ids).write({'wa_account_id': account.id})
+        return accounts
+
+    def _whatsapp_get_account(self):
+        """Account this conversation is sent from, see ``_whatsapp_get_accounts``"""
+        self.ensure_one()
+        return self._whatsapp_get_accounts()[self.id]
+
+    def _whatsapp_send_bulk(self, body=None, template=None):
+        """Send the same message to every WhatsApp channel of self.
+
+        All records are created with one ``create`` per model and the accounts
+        are resolved at once; the send queue worker delivers them afterwards.
+        Templates are sent from their own account, free form messages from
+        the account of each conversation. With a template, ``body`` fills its
+        body variable and is required when the template has one.
+        """
+        channels = self.filtered(lambda c: c.channel_type == 'whatsapp')
+        MailMessage = self.env['mail.message'].sudo()
+        if not channels or not (body or template):
+            return MailMessage
+
+        if not template:
+            # free form messages are refused outside of the session window
+            window_state = self._whatsapp_get_window_state(channels.ids)
+            closed = channels.filtered(lambda c: not window_state.get(c.id, (False, None))[0])
+            if closed:
+                _logger.info("Skipping %s WhatsApp channels with a closed session window", len(closed))
+            channels -= closed
+            if not channels:
+                return MailMessage
+
+        body_variables = self.env['whatsapp.template.variable']
+        if template:
+            # the message fills the body variable of the template, if it has one
+            body_variables = template.variable_ids.filtered(lambda v: v.line_type == 'body')
+            if len(body_variables) > 1:
+                raise UserError(_("Template %s has several body variables, it cannot be sent in bulk", template.name))
+            if body_variables and not body:
+                raise UserError(_("Template %s needs a message to fill its body variable", template.name))
+
+        if template:
+            accounts = dict.fromkeys(channels.ids, template.wa_account_id)
+        else:
+            accounts = channels._whatsapp_get_accounts()
+        if not any(accounts.values()):
+            raise UserError(_("No active WhatsApp account found"))
+
+        body = body or template.body or ''
+        plain_body = html2plaintext(body) if body else ''
+        subtype_id = self.env.ref('mail.mt_comment').id
+        author_id = self.env.user.partner_id.id
+
+        channels = channels.filtered(lambda c: c.whatsapp_phone and accounts[c.id])
+
+        messages = MailMessage.with_context(whatsapp_skip_records=True).create([{
+            'body': body,
+            'message_type': 'whatsapp',
+            'model': 'discuss.channel',
+            'res_id': channel.id,
+            'author_id': author_id,
+            'subtype_id': subtype_id,
+            'is_whatsapp': True,
+            'whatsapp_phone': channel.whatsapp_phone,
+        } for channel in channels])
+
+        base_vals = {
+            'message_type': 'outbound',
+            'state': 'outgoing',
+        }
+        if template:
+            base_vals.update({
+                'wa_template_id': template.id,
+                'template_lang_code': template.lang_code,
+            })
+        else:
+            base_vals['free_text_json'] = json.dumps({'body': plain_body})
+
+        official_messages = self.env['whatsapp.message'].sudo().create([dict(
+            base_vals,
+            mobile_number=message.whatsapp_phone,
+            mobile_number_formatted=message.whatsapp_phone,
+            mail_message_id=message.id,
+            wa_account_id=accounts[message.res_id].id,
+        ) for message in messages])
+
+        if body_variables:
+            # the message is used as the body variable of the template
+            self.env['whatsapp.message.template.component'].sudo().create([{
+                'message_id': official_message.id,
+                'component_type': 'body',
+                'variables': json.dumps([plain_body]),
+            } for official_message in official_messages])
+
+        # link each message to its official message with a single update
+        self.env.cr.execute("""
+            UPDATE mail_message m
+               SET official_whatsapp_message_id = link.official_id
+              FROM unnest(%s::int[], %s::int[]) AS link(id, official_id)
+             WHERE m.id = link.id
+        """, [messages.ids, official_messages.ids])
+        messages.invalidate_recordset(['official_whatsapp_message_id'])
+
+        return messages
+
+    def _whatsapp_bus_partners(self):
+        """Partners that see this conversation in the custom chat"""
+        self.ensure_one()
+        return self.channel_member_ids.partner_id | self.create_uid.partner_id
+
+    def _whatsapp_notify(self, notification_type, payload, partners=None):
+        """Send a compact bus notification about each channel of self"""
+        notifications = []
+        for channel in self:
+            targets = partners if partners is not None else channel._whatsapp_bus_partners()
+            for partner in targets:
+                notifications.append((partner, notification_type, dict(payload, channel_id=channel.id)))
+        if notifications:
+            self.env['bus.bus'].sudo()._sendmany(notifications)
+
+    def _whatsapp_notify_message(self, messages, status_map=None):
+        """Publish newly created WhatsApp messages of these channels, with a
+        single bus send for the whole batch"""
+        channels = {channel.id: channel for channel in self}
+        notifications = []
+        for values in messages._whatsapp_format_messages(status_map):
+            channel = channels.get(messages.browse(values['id']).res_id)
+            if not channel:
+                continue
+            values['create_date'] = fields.Datetime.to_string(values['create_date'])
+            values['date'] = fields.Datetime.to_string(values['date'])
+
+            preview = values['body']
+            if preview:
+                try:
+                    preview = html2plaintext(preview)
+                except Exception:
+                    pass
+
+            payload = {
+                'message': values,
+                'last_message': preview,
+                'channel_id': channel.id,
+            }
+            for partner in channel._whatsapp_bus_partners():
+                notifications.append((partner, 'whatsapp_custom_page/message', payload))
+        if notifications:
+            self.env['bus.bus'].sudo()._sendmany(notifications)
+
+    def _whatsapp_notify_unread(self, partner, unread_count):
+        """Publish the unread counter of a single member"""
+        self._whatsapp_notify('whatsapp_custom_page/unread', {
+            'unread_count': unread_count,
+        }, partners=partner)
@@ -0,0 +1,258 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+# size of the blocks copied between streams, in bytes
+CHUNK_SIZE = 1024 * 1024
+# size of the chunks sent by the client for resumable uploads, in bytes
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# largest file accepted by the chunked uploads, in bytes: the WhatsApp media
+# size limit
+UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+# filestore directory holding the chunked uploads in progress
+UPLOAD_DIR = 'whatsapp_uploads'
+# chunked uploads left untouched for longer are removed, in seconds
+UPLOAD_TTL = 24 * 60 * 60
+# bounding box of the previews shown in the message bubbles
+THUMBNAIL_SIZE = '256x256'
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    # poster frame of a video, generated by the chat when uploading it
+    whatsapp_thumbnail_id = fields.Many2one('ir.attachment', string='WhatsApp Thumbnail', ondelete='set null')
+
+    def _whatsapp_format_attachments(self):
+        """Attachment values for the custom chat, with cacheable URLs.
+
+        The checksum is used as ``unique`` key so the browser keeps the files
+        for good, and bubbles only load the small ``thumbnail_url``.
+        """
+        result = []
+        for attachment in self:
+            unique = attachment.checksum or ''
+            mimetype = attachment.mimetype or ''
+            thumbnail_url = False
+            if mimetype.startswith('image/'):
+                preview_url = f'/web/image/{attachment.id}?unique={unique}'
+                thumbnail_url = f'/web/image/{attachment.id}/{THUMBNAIL_SIZE}?unique={unique}'
+            else:
+                preview_url = f'/web/content/{attachment.id}?unique={unique}'
+                thumbnail = attachment.whatsapp_thumbnail_id
+                if thumbnail:
+                    thumbnail_url = f'/web/image/{thumbnail.id}/{THUMBNAIL_SIZE}?unique={thumbnail.checksum or ""}'
+            result.append({
+                'id': attachment.id,
+                'name': attachment.name,
+                'filename': attachment.name,
+                'mimetype': attachment.mimetype,
+                'checksum': attachment.checksum,
+                'url': f'/web/content/{attachment.id}?download=true&unique={unique}',
+                'preview_url': preview_url,
+                'thumbnail_url': thumbnail_url,
+            })
+        return result
+
+    def _whatsapp_set_thumbnail(self, stream):
+        """Attach the poster image read from ``stream`` to the video of self"""
+        self.ensure_one()
+        thumbnail = self._whatsapp_create_from_stream(stream, {
+            'name': f'{self.name}.thumbnail.jpg',
+            'res_model': 'ir.attachment',
+            'res_id': self.id,
+            'mimetype': 'image/jpeg',
+        })
+        self.whatsapp_thumbnail_id = thumbnail
+        return thumbnail
+
+    @api.model
+    def _whatsapp_create_from_stream(self, stream, vals):
+        """Create a binary attachment from a file-like object.
+
+        With the file storage the content is copied to the filestore block by
+        block while its checksum is computed, so it is never held in memory
+        (nor base64 encoded) as a whole.
+        """
+        if self._storage() != 'file':
+            return self.create(dict(vals, raw=stream.read()))
+
+        upload_dir = self._whatsapp_upload_dir()
+        with tempfile.NamedTemporaryFile(dir=upload_dir, delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                tmp.write(chunk)
+        return self._whatsapp_create_from_file(tmp.name, vals)
+
+    @api.model
+    def _whatsapp_create_from_file(self, path, vals):
+        """Create a binary attachment by moving ``path`` into the filestore"""
+        sha = hashlib.sha1()
+        size = 0
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                size += len(chunk)
+        checksum = sha.hexdigest()
+
+        # same layout as ir.attachment._get_path
+        fname = checksum[:2] + '/' + checksum
+        full_path = self._full_path(fname)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if os.path.isfile(full_path):
+            # identical content already stored
+            os.unlink(path)
+        else:
+            os.replace(path, full_path)
+            # let the filestore garbage collector drop it if the transaction fails
+            self._mark_for_gc(fname)
+
+        # the same file sent again to the same record reuses its attachment
+        existing = self.search([
+            ('checksum', '=', checksum),
+            ('res_model', '=', vals.get('res_model')),
+            ('res_id', '=', vals.get('res_id')),
+            ('name', '=', vals.get('name')),
+            ('mimetype', '=', vals.get('mimetype')),
+        ], limit=1)
+        if existing:
+            return existing
+
+        return self.create(dict(
+            vals,
+            type='binary',
+            store_fname=fname,
+            file_size=size,
+            checksum=checksum,
+        ))
+
+    @api.model
+    def _whatsapp_upload_dir(self):
+        path = self._full_path(UPLOAD_DIR)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @api.model
+    def _whatsapp_upload_paths(self, upload_id):
+        """Data and metadata files of a chunked upload"""
+        # upload ids are generated by us, refuse anything else
+        try:
+            upload_id = uuid.UUID(upload_id).hex
+        except (TypeError, ValueError):
+            raise UserError(_("Invalid upload"))
+        upload_dir = self._whatsapp_upload_dir()
+        return os.path.join(upload_dir, f'{upload_id}.part'), os.path.join(upload_dir, f'{upload_id}.json')
+
+    @api.model
+    def _whatsapp_upload_start(self, res_model, res_id, filename, mimetype, size):
+        """Open a resumable chunked upload and return its id.
+
+        Chunks bypass the request size limit of the server, so the announced
+        size is capped by ``whatsapp_custom_page.upload_max_size`` (bytes).
+        """
+        size = int(size)
+        max_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'whatsapp_custom_page.upload_max_size', UPLOAD_MAX_SIZE))
+        if size <= 0:
+            raise UserError(_("The file is empty"))
+        if size > max_size:
+            raise UserError(_("The file is too large, the maximum size is %s MB", max_size // (1024 * 1024)))
+        upload_id = uuid.uuid4().hex
+        data_path, meta_path = self._whatsapp_upload_paths(upload_id)
+        open(data_path, 'wb').close()
+        with open(meta_path, 'w') as meta:
+            json.dump({
+                'uid': self.env.uid,
+                'res_model': res_model,
+                'res_id': res_id,
+                'filename': filename,
+                'mimetype': mimetype,
+                'size': size,
+            }, meta)
+        return upload_id
+
+    @api.model
+    def _whatsapp_upload_info(self, upload_id):
+        """Metadata and current offset of a chunked upload of the current user"""
+        data_path, meta_path = self._whatsapp_upload_paths(upload_id)
+        if not os.path.isfile(meta_path) or not os.path.isfile(data_path):
+            raise UserError(_("Upload not found"))
+        with open(meta_path) as meta:
+            info = json.load(meta)
+        if info['uid'] != self.env.uid:
+            raise UserError(_("Upload not found"))
+        info['offset'] = os.path.getsize(data_path)
+        return info
+
+    @api.model
+    def _whatsapp_upload_chunk(self, upload_id, offset, stream):
+        """Write a chunk at ``offset`` and return the new offset.
+
+        The chunk replaces whatever was received from ``offset`` on, so that
+        a chunk sent again after a network error is not stored twice. A chunk
+        sent past the received data is ignored and clients resume from the
+        returned offset.
+        """
+        info = self._whatsapp_upload_info(upload_id)
+        offset = int(offset)
+        if offset < 0 or offset > info['offset']:
+            return info['offset']
+        data_path, _meta_path = self._whatsapp_upload_paths(upload_id)
+        # never read more than what is left of the announced size
+        remaining = info['size'] - offset
+        with open(data_path, 'r+b') as data:
+            data.seek(offset)
+            while remaining > 0:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                data.write(chunk)
+                remaining -= len(chunk)
+            too_large = bool(stream.read(1))
+            data.truncate()
+            offset = data.tell()
+        if too_large:
+            self._whatsapp_upload_abort(upload_id)
+            raise UserError(_("Upload is larger than announced"))
+        return offset
+
+    @api.model
+    def _whatsapp_upload_finish(self, upload_id):
+        """Turn a complete chunked upload into an attachment"""
+        info = self._whatsapp_upload_info(upload_id)
+        if info['offset'] != info['size']:
+            raise UserError(_("Upload is incomplete"))
+        data_path, meta_path = self._whatsapp_upload_paths(upload_id)
+        attachment = self._whatsapp_create_from_file(data_path, {
+            'name': info['filename'],
+            'res_model': info['res_model'],
+            'res_id': info['res_id'],
+            'mimetype': info['mimetype'],
+        })
+        os.unlink(meta_path)
+        return attachment
+
+    @api.model
+    def _whatsapp_upload_abort(self, upload_id):
+        for path in self._whatsapp_upload_paths(upload_id):
+            if os.path.isfile(path):
+                os.unlink(path)
+
+    @api.model
+    def _whatsapp_gc_uploads(self):
+        """Remove chunked uploads abandoned for longer than UPLOAD_TTL"""
+        upload_dir = self._whatsapp_upload_dir()
+        limit = time.time() - UPLOAD_TTL
+        for name in os.listdir(upload_dir):
+            path = os.path.join(upload_dir, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.unlink(path)
+            except OSError as e:
+                _logger.warning("Could not remove stale WhatsApp upload %s: %s", name, str(e))
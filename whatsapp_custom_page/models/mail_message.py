@@ -1,12 +1,66 @@
 from odoo import models, fields, api, _
 from odoo.tools import html2plaintext
+from odoo.tools.sql import create_index, escape_psql
 import logging
 import psycopg2
 import json
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 
 _logger = logging.getLogger(__name__)
 
+# whatsapp.message state -> status shown in the chat
+WHATSAPP_STATUS_MAPPING = {
+    'outgoing': 'sent',  # queued, shown as sent like the optimistic bubble
+    'sent': 'sent',
+    'delivered': 'delivered',
+    'read': 'read',
+    'error': 'failed'
+}
+
+# status of the chat (or of a WhatsApp receipt) -> whatsapp.message state
+WHATSAPP_STATE_MAPPING = {
+    'sent': 'sent',
+    'delivered': 'delivered',
+    'read': 'read',
+    'failed': 'error',
+}
+
+# receipts only move a message forward, they can arrive out of order
+WHATSAPP_STATE_RANK = {
+    'outgoing': 0,
+    'sent': 1,
+    'delivered': 2,
+    'read': 3,
+}
+
+# SQL predicate selecting the WhatsApp messages of a conversation, shared by
+# the partial indexes and the queries that must be able to use them
+WHATSAPP_MESSAGE_WHERE = "model = 'discuss.channel' AND (is_whatsapp OR message_type IN ('whatsapp_message', 'whatsapp'))"
+
+# latest WhatsApp message of each channel of %s (an array of ids), one
+# LIMIT 1 backward scan of mail_message_whatsapp_res_id_id_index per channel
+LAST_MESSAGE_QUERY = """
+    SELECT channel.id, last_message.id
+      FROM unnest(%s) AS channel(id)
+      JOIN LATERAL (
+            SELECT message.id
+              FROM mail_message message
+             WHERE message.model = 'discuss.channel'
+               AND message.res_id = channel.id
+               AND (message.message_type IN ('whatsapp_message', 'whatsapp') OR message.is_whatsapp)
+          ORDER BY message.id DESC
+             LIMIT 1
+           ) last_message ON TRUE
+"""
+
+# maximum number of matches returned by a message search
+SEARCH_RESULT_LIMIT = 50
+# maximum number of conversations matched by the content of their messages
+SEARCH_CHANNEL_LIMIT = 1000
+# characters kept around the match in search snippets
+SEARCH_SNIPPET_CONTEXT = 40
+
 class WhatsAppMessageTemplateComponent(models.Model):
     _name = 'whatsapp.message.template.component'
     _description = 'WhatsApp Message Template Component'
@@ -57,13 +111,230 @@ class WhatsAppMessage(models.Model):
     mail_message_id = fields.Many2one('mail.message', string='Mail Message')
     attachment_ids = fields.Many2many('ir.attachment', string='Attachments')
 
+    def init(self):
+        super().init()
+        # the sync endpoint walks status transitions by (write_date, id)
+        create_index(self._cr, 'whatsapp_message_write_date_id_index', self._table, ['write_date', 'id'])
+        # the send queue only ever looks at outgoing messages
+        create_index(self._cr, 'whatsapp_message_outgoing_index', self._table, ['id'], where="state = 'outgoing'")
+        # delivery and read receipts reference messages by their WhatsApp id
+        create_index(self._cr, 'whatsapp_message_msg_uid_index', self._table, ['msg_uid'], where="msg_uid IS NOT NULL")
+
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
-        for record in records:
-            record._send_message(with_commit=True)
+        # outgoing messages are sent by the queue worker, outside of the request
+        records.filtered(lambda r: r.state == 'outgoing')._whatsapp_enqueue()
         return records
 
+    def write(self, vals):
+        result = super().write(vals)
+
+        # push status transitions to the chat widget
+        if 'state' in vals:
+            self._whatsapp_sync_channel_status()
+            self._whatsapp_notify_status()
+
+        return result
+
+    def _whatsapp_sync_channel_status(self):
+        """Refresh the last message status of the channels these messages ended"""
+        mail_messages = self.sudo().mail_message_id
+        if not mail_messages:
+            return
+        channels = self.env['discuss.channel'].sudo().search([
+            ('whatsapp_last_message_id', 'in', mail_messages.ids),
+        ])
+        status_map = channels.whatsapp_last_message_id._whatsapp_get_status_map()
+        for channel in channels:
+            channel.whatsapp_last_message_status = status_map[channel.whatsapp_last_message_id.id]
+
+    def _whatsapp_notify_status(self):
+        """Publish the current status of these messages on their channels"""
+        by_channel = {}
+        for record in self.sudo():
+            mail_message = record.mail_message_id
+            if not mail_message or mail_message.model != 'discuss.channel' or not mail_message.res_id:
+                continue
+            status = WHATSAPP_STATUS_MAPPING.get(record.state)
+            if status:
+                by_channel.setdefault(mail_message.res_id, []).append({
+                    'message_id': mail_message.id,
+                    'status': status,
+                })
+
+        channels = self.env['discuss.channel'].sudo().browse(list(by_channel)).exists()
+        for channel in channels.filtered(lambda c: c.channel_type == 'whatsapp'):
+            channel._whatsapp_notify('whatsapp_custom_page/status', {
+                'statuses': by_channel[channel.id],
+            })
+
+    @api.model
+    def _whatsapp_apply_receipts(self, receipts):
+        """Apply a batch of delivery / read receipts.
+
+        ``receipts`` is an iterable of ``(msg_uid, status)`` pairs in the
+        order they were received, status being 'sent', 'delivered', 'read'
+        or 'failed'. Only the last status of each message counts, and a
+        message never moves back (a late 'delivered' leaves a read message
+        read). Messages are grouped by target state, so the batch costs one
+        search and one write per state.
+
+        :returns: the updated messages
+        """
+        targets = {}
+        for msg_uid, status in receipts:
+            state = WHATSAPP_STATE_MAPPING.get(status)
+            if not msg_uid or not state:
+                continue
+            # the last receipt wins unless it moves the message back, the
+            # same rule as the filter on the stored state below
+            current = targets.get(msg_uid)
+            if current is None or self._whatsapp_can_move(current, state):
+                targets[msg_uid] = state
+
+        by_state = {}
+        for msg_uid, state in targets.items():
+            by_state.setdefault(state, []).append(msg_uid)
+
+        updated = self.browse()
+        for state, msg_uids in by_state.items():
+            previous_states = [s for s in list(WHATSAPP_STATE_RANK) + ['error'] if self._whatsapp_can_move(s, state)]
+            messages = self.sudo().search([('msg_uid', 'in', msg_uids), ('state', 'in', previous_states)])
+            if messages:
+                messages.write({'state': state})
+                updated |= messages
+        return updated
+
+    @api.model
+    def _whatsapp_can_move(self, current, state):
+        """Whether a receipt may move a message from ``current`` to ``state``:
+        a failure only applies to messages not delivered yet, any other
+        status only moves forward, or away from a failure"""
+        if state == 'error':
+            return current in ('outgoing', 'sent')
+        return current == 'error' or WHATSAPP_STATE_RANK.get(current, -1) < WHATSAPP_STATE_RANK[state]
+
+    @api.model
+    def _process_statuses(self, value):
+        """Apply the receipts of a webhook payload as one batch, instead of a
+        search, a write and a bus notification per receipt"""
+        statuses = value.get('statuses') or []
+        receipts = [status for status in statuses if status.get('status') in WHATSAPP_STATE_MAPPING]
+        others = [status for status in statuses if status.get('status') not in WHATSAPP_STATE_MAPPING]
+        if others:
+            super()._process_statuses(dict(value, statuses=others))
+        if not receipts:
+            return
+
+        updated = self._whatsapp_apply_receipts((status.get('id'), status['status']) for status in receipts)
+
+        # failure details of the messages that just failed
+        errors = {
+            status.get('id'): status['errors'][0]
+            for status in receipts if status['status'] == 'failed' and status.get('errors')
+        }
+        for message in updated.filtered(lambda m: m.state == 'error' and m.msg_uid in errors):
+            error = errors[message.msg_uid]
+            details = (error.get('error_data') or {}).get('details', '')
+            message._handle_error(f"{error.get('code')} : {error.get('title')}\n{error.get('message', '')} {details}".strip())
+
+        # the fetched / seen pointers of the customer only need the newest
+        # message of each channel, delivered ones first
+        latest = {}
+        for message in updated.filtered(lambda m: m.state in ('delivered', 'read')):
+            mail_message = message.mail_message_id
+            if mail_message.model != 'discuss.channel':
+                continue
+            key = (mail_message.res_id, message.state)
+            if key not in latest or mail_message.id > latest[key].mail_message_id.id:
+                latest[key] = message
+        for message in sorted(latest.values(), key=lambda m: WHATSAPP_STATE_RANK[m.state]):
+            message._update_message_fetched_seen()
+
+    def _whatsapp_enqueue(self):
+        """Wake up the send queue worker for these outgoing messages"""
+        if self:
+            self.env.ref('whatsapp_custom_page.ir_cron_whatsapp_send_queue').sudo()._trigger()
+
+    @api.model
+    def _send_cron(self):
+        # the queue cron of the whatsapp module picks the same outgoing
+        # messages; it goes through the locked queue as well, so that the two
+        # crons never send a message twice
+        self._process_send_queue()
+
+    @api.model
+    def _process_send_queue(self):
+        """Send queued outgoing messages, batched and rate limited per account.
+
+        The per minute quota of each account is checked against the sends
+        this process recorded with ``_whatsapp_record_send``. Each message is
+        locked, re-checked and committed on its own so that concurrent
+        workers never send it twice. Failed sends are retried with an
+        exponential backoff based on ``retry_count`` / ``last_retry``.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch_size = int(ICP.get_param('whatsapp_custom_page.send_batch_size', 100))
+        max_retries = int(ICP.get_param('whatsapp_custom_page.send_max_retries', 5))
+        retry_delay = int(ICP.get_param('whatsapp_custom_page.send_retry_delay', 60))
+
+        self.flush_model(['state', 'retry_count', 'last_retry'])
+        self.env.cr.execute("""
+            SELECT id, wa_account_id
+              FROM whatsapp_message
+             WHERE state = 'outgoing'
+               AND (last_retry IS NULL
+                    OR last_retry + make_interval(secs => %s * power(2, retry_count - 1)) <= (now() at time zone 'UTC'))
+          ORDER BY id
+             LIMIT %s
+        """, [retry_delay, batch_size])
+        rows = self.env.cr.fetchall()
+
+        # never send more than the quota of an account within a minute
+        Account = self.env['whatsapp.account']
+        rate_limited = retrying = False
+        for message_id, account_id in rows:
+            if Account._whatsapp_get_send_rate(account_id) >= Account._whatsapp_get_rate_limit(account_id):
+                rate_limited = True
+                continue
+
+            # skip messages another worker is sending or has already sent
+            self.env.cr.execute("""
+                SELECT id FROM whatsapp_message
+                 WHERE id = %s AND state = 'outgoing'
+                   FOR UPDATE SKIP LOCKED
+            """, [message_id])
+            if not self.env.cr.fetchone():
+                continue
+
+            record = self.browse(message_id)
+            record.invalidate_recordset()
+            record.wa_account_id._whatsapp_record_send()
+            record._send_message()
+
+            if record.state == 'error' and record.failure_type in ('SEND_ERROR', 'API_ERROR') \
+                    and record.retry_count < max_retries:
+                record.write({
+                    'state': 'outgoing',
+                    'retry_count': record.retry_count + 1,
+                    'last_retry': fields.Datetime.now(),
+                })
+                retrying = True
+
+            if not getattr(threading.current_thread(), 'testing', False):
+                self.env.cr.commit()
+
+        cron = self.env.ref('whatsapp_custom_page.ir_cron_whatsapp_send_queue').sudo()
+        if rate_limited:
+            # come back for what is left once the rate limit window has passed
+            cron._trigger(fields.Datetime.now() + timedelta(seconds=retry_delay))
+        elif len(rows) >= batch_size:
+            # only the batch size stopped us, go on with the next batch now
+            cron._trigger()
+        elif retrying:
+            cron._trigger(fields.Datetime.now() + timedelta(seconds=retry_delay))
+
     def _send_message(self, with_commit=False):
         self.ensure_one()
         try:
@@ -132,90 +403,139 @@ class MailMessage(models.Model):
         ('failed', 'Failed')
     ], string='WhatsApp Status', default='sent')
     whatsapp_message_id = fields.Char('WhatsApp Message ID')
-    whatsapp_phone = fields.Char('WhatsApp Phone Number')
+    whatsapp_phone = fields.Char('WhatsApp Phone Number', index='btree_not_null')
     official_whatsapp_message_id = fields.Many2one('whatsapp.message', string='Official WhatsApp Message', ondelete='set null')
     error_message = fields.Text('Error Message')
 
-    @api.model
-    def create(self, vals):
-        # check if this is a message from official WhatsApp module
-        if vals.get('message_type') == 'whatsapp' and vals.get('model') == 'discuss.channel':
-            channel = self.env['discuss.channel'].sudo().browse(vals.get('res_id'))
-            if channel.exists() and channel.channel_type == 'whatsapp':
-                vals.update({
-                    'is_whatsapp': True,
-                    'subtype_id': self.env.ref('mail.mt_comment').id,
-                })
-                # extract phone number from channel name
-                phone = channel.name.split(' - ')[0] if ' - ' in channel.name else channel.name
-                phone = ''.join(filter(str.isdigit, phone))
-                if phone:
-                    vals['whatsapp_phone'] = phone
+    def init(self):
+        super().init()
+        # message history, keyset pages and latest message of a conversation
+        create_index(
+            self._cr, 'mail_message_whatsapp_res_id_id_index', self._table,
+            ['res_id', 'id'], where=WHATSAPP_MESSAGE_WHERE,
+        )
+        # latest message of the customer, used for the 24h session window
+        create_index(
+            self._cr, 'mail_message_whatsapp_res_id_create_date_index', self._table,
+            ['res_id', 'create_date DESC', 'id DESC'],
+            where="model = 'discuss.channel' AND message_type IN ('whatsapp_message', 'whatsapp')",
+        )
+        # trigram index over WhatsApp message bodies for the search box
+        if self.env.registry.has_trigram:
+            create_index(
+                self._cr, 'mail_message_whatsapp_body_trgm_index', self._table,
+                ['body gin_trgm_ops'], method='gin', where=WHATSAPP_MESSAGE_WHERE,
+            )
 
-        # create the message
-        message = super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        # resolve the WhatsApp channels of the batch at once
+        channel_ids = {vals.get('res_id') for vals in vals_list if vals.get('model') == 'discuss.channel' and vals.get('res_id')}
+        channels = self.env['discuss.channel'].sudo().browse(list(channel_ids)).exists()
+        whatsapp_channels = {channel.id: channel for channel in channels if channel.channel_type == 'whatsapp'}
+
+        for vals in vals_list:
+            # check if this is a message from official WhatsApp module
+            if vals.get('message_type') == 'whatsapp' and vals.get('model') == 'discuss.channel':
+                channel = whatsapp_channels.get(vals.get('res_id'))
+                if channel:
+                    vals.update({
+                        'is_whatsapp': True,
+                        'subtype_id': self.env.ref('mail.mt_comment').id,
+                    })
+                    # normalized phone stored on the channel
+                    if channel.whatsapp_phone:
+                        vals['whatsapp_phone'] = channel.whatsapp_phone
 
-        # wa message created from our custom module
-        if message.is_whatsapp and not message.official_whatsapp_message_id:
-            try:
-                channel = self.env['discuss.channel'].sudo().browse(message.res_id)
-                if channel.exists() and channel.channel_type == 'whatsapp':
+        # create the messages
+        messages = super().create(vals_list)
+
+        for message in messages:
+            if message.model != 'discuss.channel' or message.res_id not in whatsapp_channels:
+                continue
+            channel = whatsapp_channels[message.res_id]
+
+            # wa message created from our custom module, batch senders create their own
+            if message.is_whatsapp and not message.official_whatsapp_message_id \
+                    and not self.env.context.get('whatsapp_skip_records'):
+                try:
                     self._create_whatsapp_records(message, channel)
+                except Exception as e:
+                    _logger.error("Error creating WhatsApp records: %s", str(e))
+                    message.write({
+                        'whatsapp_status': 'failed',
+                        'error_message': str(e)
+                    })
+
+        whatsapp_messages = messages.filtered(
+            lambda m: m.model == 'discuss.channel' and m.res_id in whatsapp_channels
+            and (m.is_whatsapp or m.message_type in ['whatsapp_message', 'whatsapp'])
+        )
+        if whatsapp_messages:
+            # the status of the whole batch is read once, then the conversation
+            # list summary and session window are written once per channel
+            status_map = whatsapp_messages._whatsapp_get_status_map()
+            channels = self.env['discuss.channel'].sudo().browse(list(set(whatsapp_messages.mapped('res_id'))))
+            channels._whatsapp_update_last_message(whatsapp_messages, status_map)
+            channels._whatsapp_update_last_inbound(whatsapp_messages)
+
+            # push the new messages to the agents following the conversations
+            try:
+                channels._whatsapp_notify_message(whatsapp_messages, status_map)
             except Exception as e:
-                _logger.error("Error creating WhatsApp records: %s", str(e))
-                message.write({
-                    'whatsapp_status': 'failed',
-                    'error_message': str(e)
-                })
+                _logger.error("Error publishing WhatsApp message notification: %s", str(e))
 
-        return message
+        return messages
 
     def write(self, vals):
         result = super().write(vals)
 
-        # handle status updates
+        # propagate the status to all the official messages with one write
         if 'whatsapp_status' in vals:
-            for record in self:
-                if record.official_whatsapp_message_id:
-                    status_mapping = {
-                        'sent': 'sent',
-                        'delivered': 'delivered',
-                        'read': 'read',
-                        'failed': 'error'
-                    }
-                    new_state = status_mapping.get(vals['whatsapp_status'])
-                    if new_state:
-                        record.official_whatsapp_message_id.write({
-                            'state': new_state,
-                            'error_message': vals.get('error_message')
-                        })
+            new_state = WHATSAPP_STATE_MAPPING.get(vals['whatsapp_status'])
+            official_messages = self.official_whatsapp_message_id
+            if new_state == 'sent':
+                # a queued message only becomes sent once the worker sent it
+                official_messages = official_messages.filtered(lambda m: m.state != 'outgoing')
+            if new_state and official_messages:
+                official_messages.write({
+                    'state': new_state,
+                    'error_message': vals.get('error_message')
+                })
+
+            # keep the status shown in the conversation list in sync
+            channels = self.env['discuss.channel'].sudo().search([
+                ('whatsapp_last_message_id', 'in', self.ids),
+            ])
+            status_map = channels.whatsapp_last_message_id._whatsapp_get_status_map()
+            for channel in channels:
+                channel.whatsapp_last_message_status = status_map[channel.whatsapp_last_message_id.id]
 
         return result
 
+    def unlink(self):
+        channels = self.env['discuss.channel'].sudo().search([
+            ('whatsapp_last_message_id', 'in', self.ids),
+        ])
+        result = super().unlink()
+        if channels:
+            channels._whatsapp_recompute_last_message()
+        return result
+
     def _create_whatsapp_records(self, message, channel):
         if not message.whatsapp_phone:
             return
 
         try:
-            # get wa account
-            wa_account = self.env['whatsapp.account'].sudo().search([('active', '=', True)], limit=1)
+            # account the conversation is pinned to, or routed on its first message
+            wa_account = channel._whatsapp_get_account()
             if not wa_account:
                 _logger.error("No active WhatsApp account found")
                 message.whatsapp_status = 'failed'
                 return
 
-            # check if we can send a session message
-            can_send_session = False
-            last_inbound = self.env['mail.message'].sudo().search([
-                ('model', '=', 'discuss.channel'),
-                ('res_id', '=', channel.id),
-                ('message_type', 'in', ['whatsapp_message', 'whatsapp']),
-                ('author_id', '!=', self.env.user.partner_id.id),  # not from current user
-            ], order='create_date desc', limit=1)
-
-            if last_inbound:
-                time_diff = fields.Datetime.now() - last_inbound.create_date
-                can_send_session = time_diff.total_seconds() <= 24 * 60 * 60  # 24 hours in seconds
+            # check if we can send a session message, the window is stored on the channel
+            can_send_session = channel._whatsapp_window_open()
 
             body = html2plaintext(message.body) if message.body else ''
 
@@ -234,22 +554,8 @@ class MailMessage(models.Model):
 
             # if can't send a session message use a template
             if not can_send_session:
-                # first try to find the 'sale' template
-                utility_template = self.env['whatsapp.template'].sudo().search([
-                    ('name', '=', 'sale'),
-                    ('status', '=', 'approved'),
-                    ('wa_account_id', '=', wa_account.id)
-                ], limit=1)
-
-                if not utility_template:
-                    # log template search
-                    _logger.info("Sale template not found, searching for any utility template")
-                    # search for any utility template using correct field name 'template_type'
-                    utility_template = self.env['whatsapp.template'].sudo().search([
-                        ('template_type', '=', 'utility'),
-                        ('status', '=', 'approved'),
-                        ('wa_account_id', '=', wa_account.id)
-                    ], limit=1)
+                # 'sale' template or any utility template, resolved once per account
+                utility_template = self.env['whatsapp.template']._whatsapp_get_fallback_template(wa_account)
 
                 if not utility_template:
                     message.whatsapp_status = 'failed'
@@ -268,9 +574,6 @@ class MailMessage(models.Model):
                 official_message = WhatsAppMessage.create(base_vals)
 
                 if official_message:
-                    # get template variables
-                    body_variables = utility_template.variable_ids.filtered(lambda v: v.line_type == 'body')
-                    
                     # prepare default variable values
                     default_values = [body]  # Use the message as the first variable
 
@@ -304,22 +607,8 @@ class MailMessage(models.Model):
                     'whatsapp_status': 'sent'
                 })
 
-                # force update channel
-                channel.write({
-                    'write_date': fields.Datetime.now(),
-                })
-
-                # trigger immediate processing
-                try:
-                    official_message.sudo()._send_message(with_commit=True)
-                except Exception as e:
-                    _logger.error("Error sending message immediately: %s", str(e))
-                    # try using cron job as fallback
-                    cron_job = self.env.ref('whatsapp.ir_cron_send_whatsapp_queue')
-                    if cron_job:
-                        cron_job.sudo()._trigger()
-
-                _logger.info("WhatsApp message created successfully with ID: %s", official_message.id)
+                # sending is left to the queue worker, see _process_send_queue
+                _logger.info("WhatsApp message queued successfully with ID: %s", official_message.id)
             else:
                 message.whatsapp_status = 'failed'
                 _logger.error("Failed to create WhatsApp message")
@@ -328,26 +617,163 @@ class MailMessage(models.Model):
             _logger.error("Error creating WhatsApp records: %s", str(e))
             message.whatsapp_status = 'failed'
 
+    @api.model
+    def _whatsapp_get_channel_domain(self, channel_id):
+        """Domain of the WhatsApp messages of a channel, matching the predicate
+        of the partial indexes"""
+        return [
+            ('model', '=', 'discuss.channel'),
+            ('res_id', '=', channel_id),
+            '|',
+            ('message_type', 'in', ['whatsapp_message', 'whatsapp']),
+            ('is_whatsapp', '=', True),
+        ]
+
+    @api.model
+    def _whatsapp_get_last_message_ids(self, channel_ids):
+        """Map each channel id to the id of its latest WhatsApp message"""
+        if not channel_ids:
+            return {}
+        # one LIMIT 1 index scan per channel, independent of the history size
+        self.flush_model(['model', 'res_id', 'message_type', 'is_whatsapp'])
+        self.env.cr.execute(LAST_MESSAGE_QUERY, [list(channel_ids)])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _whatsapp_search_messages(self, term, channel_ids, limit=SEARCH_RESULT_LIMIT):
+        """Search WhatsApp message bodies of the given channels.
+
+        Returns a list of ``(message_id, channel_id, rank)`` tuples, best
+        matches first. Terms shorter than three characters cannot use the
+        trigram index and return nothing.
+        """
+        term = (term or '').strip()
+        if len(term) < 3 or not channel_ids:
+            return []
+        limit = min(int(limit), SEARCH_RESULT_LIMIT)
+        self.flush_model(['model', 'res_id', 'message_type', 'is_whatsapp', 'body'])
+
+        rank = "similarity(body, %(term)s)" if self.env.registry.has_trigram else "0"
+        self.env.cr.execute(f"""
+            SELECT id, res_id, {rank} AS rank
+              FROM mail_message
+             WHERE {WHATSAPP_MESSAGE_WHERE}
+               AND res_id = ANY(%(channel_ids)s)
+               AND body ILIKE %(pattern)s
+          ORDER BY rank DESC, id DESC
+             LIMIT %(limit)s
+        """, {
+            'term': term,
+            'channel_ids': list(channel_ids),
+            'pattern': f'%{escape_psql(term)}%',
+            'limit': limit,
+        })
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _whatsapp_search_channels(self, term, channel_ids, limit=SEARCH_CHANNEL_LIMIT):
+        """Ids of the given channels with a WhatsApp message body containing
+        ``term``, each counted once however many of its messages match.
+
+        Terms shorter than three characters cannot use the trigram index and
+        match nothing.
+        """
+        term = (term or '').strip()
+        if len(term) < 3 or not channel_ids:
+            return []
+        self.flush_model(['model', 'res_id', 'message_type', 'is_whatsapp', 'body'])
+        self.env.cr.execute(f"""
+            SELECT DISTINCT res_id
+              FROM mail_message
+             WHERE {WHATSAPP_MESSAGE_WHERE}
+               AND res_id = ANY(%(channel_ids)s)
+               AND body ILIKE %(pattern)s
+             LIMIT %(limit)s
+        """, {
+            'channel_ids': list(channel_ids),
+            'pattern': f'%{escape_psql(term)}%',
+            'limit': int(limit),
+        })
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _whatsapp_search_snippet(self, term):
+        """Plain text excerpt of the message body around ``term``"""
+        self.ensure_one()
+        text = html2plaintext(self.body or '')
+        index = text.lower().find(term.lower())
+        if index == -1:
+            return text[:2 * SEARCH_SNIPPET_CONTEXT]
+        start = max(index - SEARCH_SNIPPET_CONTEXT, 0)
+        end = index + len(term) + SEARCH_SNIPPET_CONTEXT
+        return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
+
+    def _whatsapp_get_status_map(self):
+        """Map each message id to its status, reading all official messages at once"""
+        official_ids = self.official_whatsapp_message_id.ids
+        official_states = {}
+        if official_ids:
+            official_states = {
+                official['id']: official['state']
+                for official in self.env['whatsapp.message'].sudo().search_read([('id', 'in', official_ids)], ['state'])
+            }
+
+        status_map = {}
+        for message in self:
+            official_id = message.official_whatsapp_message_id.id
+            if official_id in official_states:
+                status_map[message.id] = WHATSAPP_STATUS_MAPPING.get(official_states[official_id], 'failed')
+            else:
+                status_map[message.id] = message.whatsapp_status
+        return status_map
+
+    def _whatsapp_get_status(self):
+        """Status of the message, taken from the official message if it exists"""
+        self.ensure_one()
+        return self._whatsapp_get_status_map()[self.id]
+
+    def _whatsapp_format_messages(self, status_map=None):
+        """Format messages the way the custom chat widget renders them"""
+        if status_map is None:
+            status_map = self._whatsapp_get_status_map()
+
+        result = []
+        for message in self:
+            is_outbound = message.author_id == self.env.user.partner_id
+
+            status = status_map[message.id]
+
+            attachments = message.attachment_ids._whatsapp_format_attachments()
+
+            result.append({
+                'id': message.id,
+                'body': message.body or '',
+                'author_name': message.author_id.name if message.author_id else _('Unknown'),
+                'author_id': message.author_id.id if message.author_id else False,
+                'direction': 'outbound' if is_outbound else 'inbound',
+                'create_date': message.create_date,
+                'date': message.date,
+                'status': status,
+                'attachment_ids': attachments,
+                'is_sent': is_outbound,
+                'whatsapp_message_id': message.whatsapp_message_id,
+                'official_whatsapp_message_id': message.official_whatsapp_message_id.id if message.official_whatsapp_message_id else False,
+                'error_message': message.error_message,
+            })
+        return result
+
     @api.model
     def _message_format(self, fnames=None, format_reply=True):
         """Override to add WhatsApp fields to message format"""
         res = super()._message_format(fnames=fnames, format_reply=format_reply)
         
-        WhatsAppMessage = self.env['whatsapp.message'].sudo()
+        # resolve the status of all official messages in one query
+        status_map = self._whatsapp_get_status_map()
         
         for message_dict, message in zip(res, self):
             if message.is_whatsapp or message.message_type in ['whatsapp_message', 'whatsapp']:
                 # get the latest status from official message if it exists
                 if message.official_whatsapp_message_id:
-                    official_msg = WhatsAppMessage.browse(message.official_whatsapp_message_id.id)
-                    if official_msg.exists():
-                        status_mapping = {
-                            'sent': 'sent',
-                            'delivered': 'delivered',
-                            'read': 'read',
-                            'error': 'failed'
-                        }
-                        message_dict['whatsapp_status'] = status_mapping.get(official_msg.state, 'failed')
+                    message_dict['whatsapp_status'] = status_map[message.id]
                 
                 message_dict.update({
                     'id': message.id,
@@ -365,13 +791,7 @@ class MailMessage(models.Model):
                 })
                 
                 if message.attachment_ids:
-                    message_dict['attachments'] = [{
-                        'id': att.id,
-                        'name': att.name,
-                        'filename': att.name,
-                        'mimetype': att.mimetype,
-                        'url': f'/web/content/{att.id}?download=true'
-                    } for att in message.attachment_ids]
+                    message_dict['attachments'] = message.attachment_ids._whatsapp_format_attachments()
         
         return res
 
@@ -1,114 +1,229 @@
-from odoo import models, fields, api, _
+from odoo import models, api, _
+from odoo.addons.whatsapp.tools import whatsapp_api
+from odoo.addons.whatsapp.tools.whatsapp_exception import WhatsAppError
+from .ir_attachment import CHUNK_SIZE
 import requests
-import json
-import logging
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import re
+import threading
+import uuid
 
-_logger = logging.getLogger(__name__)
+# defaults of the Graph API connection settings, see _get_http_settings;
+# retries only cover calls refused with 429 or failing to connect, never the
+# ones the API may have received already (read errors, 5xx), so nothing is
+# sent twice
+DEFAULT_HTTP_SETTINGS = {
+    'pool_size': 10,
+    'max_retries': 3,
+    'backoff_factor': 0.5,
+    'timeout': 10,
+    'media_timeout': 30,
+}
+
+# keep-alive session shared by all the threads of this worker process, and
+# the pool settings it was built with
+_http_session = None
+_http_session_key = None
+_http_session_lock = threading.Lock()
+# number of sessions (re)built in this worker process
+_http_session_resets = 0
+# settings of the Graph API call in progress in each thread
+_http_call = threading.local()
 
-class WhatsAppAccount(models.Model):
-    _name = 'whatsapp.account'
-    _description = 'WhatsApp Account'
-
-    name = fields.Char('Name', required=True)
-    webhook_url = fields.Char('Webhook URL', required=True)
-    access_token = fields.Char('Access Token', required=True)
-    active = fields.Boolean('Active', default=True)
-
-    def _send_whatsapp_message(self, message_data):
-        """Send message through WhatsApp API"""
-        self.ensure_one()
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-
-            # prepare the payload
-            payload = {
-                'messaging_product': 'whatsapp',
-                'recipient_type': 'individual',
-                'to': message_data.get('phone'),
-                'type': 'text',
-            }
-
-            #handle different types of messages
-            if message_data.get('image'):
-                payload['type'] = 'image'
-                payload['image'] = {
-                    'link': self._upload_media(message_data['image'], 'image')
-                }
-            elif message_data.get('audio'):
-                payload['type'] = 'audio'
-                payload['audio'] = {
-                    'link': self._upload_media(message_data['audio'], 'audio')
-                }
-            elif message_data.get('video'):
-                payload['type'] = 'video'
-                payload['video'] = {
-                    'link': self._upload_media(message_data['video'], 'video')
-                }
-            elif message_data.get('document'):
-                payload['type'] = 'document'
-                payload['document'] = {
-                    'link': self._upload_media(message_data['document'], 'document'),
-                    'filename': message_data.get('filename', 'document')
-                }
-            else:
-                payload['text'] = {'body': message_data.get('body', '')}
-
-            # send the message
-            response = requests.post(
-                f"{self.webhook_url}/messages",
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
 
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    'success': True,
-                    'message_id': result.get('messages', [{}])[0].get('id')
-                }
-            else:
-                _logger.error("WhatsApp API error: %s", response.text)
-                return {'success': False, 'error': response.text}
-
-        except Exception as e:
-            _logger.error("Error sending WhatsApp message: %s", str(e))
-            return {'success': False, 'error': str(e)}
-
-    def _upload_media(self, media_data, media_type):
-        """Upload media to WhatsApp servers"""
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-
-            # convert base64 to binary
-            binary_data = base64.b64decode(media_data)
-
-            # upload media
-            files = {
-                'file': (f'file.{media_type}', binary_data, f'{media_type}/octet-stream')
-            }
-            
-            response = requests.post(
-                f"{self.webhook_url}/media",
-                headers={'Authorization': headers['Authorization']},
-                files=files,
-                timeout=30
+def _get_http_session(settings):
+    """Session of the worker process, rebuilt when its pool settings change"""
+    global _http_session, _http_session_key, _http_session_resets
+    key = (settings['pool_size'], settings['max_retries'], settings['backoff_factor'])
+    if _http_session is not None and _http_session_key == key:
+        return _http_session
+    with _http_session_lock:
+        if _http_session is None or _http_session_key != key:
+            retry = Retry(
+                total=settings['max_retries'],
+                connect=settings['max_retries'],
+                read=0,
+                status=settings['max_retries'],
+                backoff_factor=settings['backoff_factor'],
+                status_forcelist=(429,),
+                allowed_methods=frozenset(['GET', 'POST', 'DELETE']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
             )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings['pool_size'], max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            previous = _http_session
+            _http_session, _http_session_key = session, key
+            _http_session_resets += 1
+            if previous is not None:
+                # idle connections are closed, calls in progress complete
+                previous.close()
+        return _http_session
+
+
+class PooledRequests:
+    """Stand-in for the ``requests`` module in the Graph API helper of the
+    whatsapp module, sending its calls over the pooled keep-alive session.
+
+    Authorization headers are set by the helper on each call, so the session
+    is shared by all the accounts.
+    """
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def request(self, method, url, **kwargs):
+        settings = getattr(_http_call, 'settings', None) or DEFAULT_HTTP_SETTINGS
+        if 'timeout' in kwargs:
+            is_upload = kwargs.get('files') or isinstance(kwargs.get('data'), MultipartFileBody)
+            kwargs['timeout'] = settings['media_timeout' if is_upload else 'timeout']
+        return _get_http_session(settings).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+# every message, template and media call of WhatsAppApi goes through
+# requests.request(), which opened a new TLS connection each time
+whatsapp_api.requests = PooledRequests()
+
+_api_requests = whatsapp_api.WhatsAppApi._WhatsAppApi__api_requests
+
+
+def _api_requests_configured(self, *args, **kwargs):
+    """Make the settings of the database available to the pooled session"""
+    Account = self.wa_account_id
+    if not hasattr(Account, '_get_http_settings'):
+        # database without this module
+        return _api_requests(self, *args, **kwargs)
+    _http_call.settings = Account._get_http_settings()
+    try:
+        return _api_requests(self, *args, **kwargs)
+    finally:
+        _http_call.settings = None
+
+
+whatsapp_api.WhatsAppApi._WhatsAppApi__api_requests = _api_requests_configured
+
+
+class MultipartFileBody:
+    """``multipart/form-data`` body of a media upload, read from the
+    filestore block by block while it is sent.
+
+    It can be iterated again, so that a retried call sends it whole, and its
+    length is known so that requests sets a Content-Length.
+    """
+
+    def __init__(self, path, filename, mimetype, fields):
+        self.path = path
+        self.boundary = uuid.uuid4().hex
+        filename = re.sub(r'[\r\n"\\]', '_', filename)
+        head = ''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'
+        )
+        self.head = head.encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self.size = os.path.getsize(path)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.path, 'rb') as data:
+            yield from iter(lambda: data.read(CHUNK_SIZE), b'')
+        yield self.tail
+
+
+_upload_whatsapp_document = whatsapp_api.WhatsAppApi._upload_whatsapp_document
+
+
+def _upload_whatsapp_document_streamed(self, attachment):
+    """Upload an attachment of the filestore without loading it in memory"""
+    path = attachment.store_fname and attachment._full_path(attachment.store_fname)
+    if not path or not os.path.isfile(path):
+        return _upload_whatsapp_document(self, attachment)
+    body = MultipartFileBody(
+        path, attachment.name or 'file', attachment.mimetype or 'application/octet-stream',
+        {'messaging_product': 'whatsapp'},
+    )
+    response = self._WhatsAppApi__api_requests(
+        "POST", f"/{self.phone_uid}/media", auth_type="bearer",
+        headers={'Content-Type': body.content_type}, data=body,
+    )
+    media_id = response.json().get('id')
+    if not media_id:
+        raise WhatsAppError(_("Document upload failed, please retry after sometime."))
+    return media_id
+
+
+def _upload_whatsapp_document_cached(self, attachment):
+    """Reuse the media the account already uploaded for the same content"""
+    MediaCache = self.wa_account_id.env.get('whatsapp.media.cache')
+    if MediaCache is None:
+        # database without this module
+        return _upload_whatsapp_document(self, attachment)
+    entry = MediaCache._lookup(self.wa_account_id, attachment.checksum)
+    if entry.media_id:
+        return entry.media_id
+    media_id = _upload_whatsapp_document_streamed(self, attachment)
+    MediaCache._store(self.wa_account_id, attachment.checksum, media_id=media_id)
+    return media_id
+
+
+# the whatsapp module builds the multipart body from attachment.raw, which
+# holds the whole file in memory a few times over, and uploads the same file
+# again for every message it is sent with
+whatsapp_api.WhatsAppApi._upload_whatsapp_document = _upload_whatsapp_document_cached
+
+
+class WhatsAppAccount(models.Model):
+    _inherit = 'whatsapp.account'
 
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('media', {}).get('link')
-            else:
-                _logger.error("Media upload error: %s", response.text)
-                return None
+    @api.model
+    def _get_http_settings(self):
+        """Pool, retry and timeout settings of the Graph API calls"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        defaults = DEFAULT_HTTP_SETTINGS
+        return {
+            'pool_size': int(ICP.get_param('whatsapp_custom_page.http_pool_size', defaults['pool_size'])),
+            'max_retries': int(ICP.get_param('whatsapp_custom_page.http_max_retries', defaults['max_retries'])),
+            'backoff_factor': float(ICP.get_param('whatsapp_custom_page.http_backoff_factor', defaults['backoff_factor'])),
+            'timeout': float(ICP.get_param('whatsapp_custom_page.http_timeout', defaults['timeout'])),
+            'media_timeout': float(ICP.get_param('whatsapp_custom_page.http_media_timeout', defaults['media_timeout'])),
+        }
 
-        except Exception as e:
-            _logger.error("Error uploading media: %s", str(e))
-            return None 
\ No newline at end of file
+    @api.model
+    def _get_http_stats(self):
+        """Connection pool counters of this worker process"""
+        session = _http_session
+        requests_count = connections = 0
+        if session is not None:
+            for adapter in session.adapters.values():
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is not None:
+                        requests_count += pool.num_requests
+                        connections += pool.num_connections
+        return {
+            'session_resets': _http_session_resets,
+            'requests': requests_count,
+            'connections': connections,
+            # requests served by an already open connection
+            'pool_hits': max(requests_count - connections, 0),
+        }
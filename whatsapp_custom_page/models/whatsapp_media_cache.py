@@ -0,0 +1,64 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# uploaded media stay available on WhatsApp for 30 days
+DEFAULT_MEDIA_TTL_DAYS = 29
+
+class WhatsAppMediaCache(models.Model):
+    _name = 'whatsapp.media.cache'
+    _description = 'WhatsApp Uploaded Media Cache'
+
+    wa_account_id = fields.Many2one('whatsapp.account', string='WhatsApp Account', required=True, ondelete='cascade')
+    checksum = fields.Char('Checksum', required=True, help="SHA1 of the uploaded content, as in ir.attachment")
+    media_id = fields.Char('Media ID')
+    media_link = fields.Char('Media Link')
+    expiry_date = fields.Datetime('Expiry Date', required=True, index=True)
+
+    _sql_constraints = [
+        ('account_checksum_uniq', 'unique(wa_account_id, checksum)', 'Media already cached for this account'),
+    ]
+
+    @api.model
+    def _get_ttl(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'whatsapp_custom_page.media_cache_ttl_days', DEFAULT_MEDIA_TTL_DAYS))
+
+    @api.model
+    def _lookup(self, wa_account, checksum):
+        """Valid cache entry of ``checksum`` for the account, if any"""
+        if not checksum:
+            return self.browse()
+        return self.sudo().search([
+            ('wa_account_id', '=', wa_account.id),
+            ('checksum', '=', checksum),
+            ('expiry_date', '>', fields.Datetime.now()),
+        ], limit=1)
+
+    @api.model
+    def _store(self, wa_account, checksum, media_id=None, media_link=None):
+        """Remember the remote media of ``checksum`` until it expires"""
+        if not checksum or not (media_id or media_link):
+            return self.browse()
+        vals = {
+            'media_id': media_id,
+            'media_link': media_link,
+            'expiry_date': fields.Datetime.now() + timedelta(days=self._get_ttl()),
+        }
+        entry = self.sudo().search([
+            ('wa_account_id', '=', wa_account.id),
+            ('checksum', '=', checksum),
+        ], limit=1)
+        if entry:
+            entry.write(vals)
+            return entry
+        return self.sudo().create(dict(vals, wa_account_id=wa_account.id, checksum=checksum))
+
+    @api.model
+    def _gc_expired(self):
+        """Drop the entries whose remote media has expired"""
+        expired = self.sudo().search([('expiry_date', '<=', fields.Datetime.now())])
+        _logger.info("Removing %s expired WhatsApp media cache entries", len(expired))
+        expired.unlink()
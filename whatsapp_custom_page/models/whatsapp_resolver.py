@@ -0,0 +1,165 @@
+from odoo import models, fields, api, tools
+from collections import defaultdict, deque
+import logging
+import random
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# fields of the accounts and templates the cached routing choices depend on
+ROUTING_FIELDS = {'whatsapp_routing_weight', 'whatsapp_rate_limit', 'active'}
+FALLBACK_TEMPLATE_FIELDS = {'name', 'status', 'template_type', 'wa_account_id', 'active'}
+
+# window of the in-memory send rate of each account, in seconds
+SEND_RATE_WINDOW = 60
+# messages per minute of an account without its own limit: the Cloud API
+# default throughput of a business phone number, 80 messages per second
+DEFAULT_SEND_RATE_LIMIT = 80 * 60
+
+# recent sends of this worker process, account id -> monotonic timestamps
+_send_times = defaultdict(deque)
+_send_times_lock = threading.Lock()
+
+class WhatsAppAccount(models.Model):
+    _inherit = 'whatsapp.account'
+
+    whatsapp_routing_weight = fields.Integer(
+        'Routing Weight', default=1,
+        help="Share of the new outbound conversations sent from this account. "
+             "0 keeps it for the conversations already pinned to it.")
+    whatsapp_rate_limit = fields.Integer(
+        'Messages per Minute', default=0,
+        help="Throughput allowed for this number, 0 uses the "
+             "whatsapp_custom_page.send_rate_limit system parameter.")
+
+    @api.model
+    @tools.ormcache()
+    def _whatsapp_get_routing_table(self):
+        """(id, weight, messages per minute) of the active accounts"""
+        # cached per registry, cleared whenever an account changes
+        default_limit = int(self.env['ir.config_parameter'].sudo().get_param('whatsapp_custom_page.send_rate_limit', DEFAULT_SEND_RATE_LIMIT))
+        return tuple(
+            (account.id, account.whatsapp_routing_weight, account.whatsapp_rate_limit or default_limit)
+            for account in self.sudo().search([('active', '=', True)], order='id')
+        )
+
+    @api.model
+    def _whatsapp_get_rate_limit(self, account_id):
+        """Messages per minute allowed for the account"""
+        for routed_id, _weight, rate_limit in self._whatsapp_get_routing_table():
+            if routed_id == account_id:
+                return rate_limit
+        # archived accounts still drain their queue at the default rate
+        return int(self.env['ir.config_parameter'].sudo().get_param('whatsapp_custom_page.send_rate_limit', DEFAULT_SEND_RATE_LIMIT))
+
+    @api.model
+    def _whatsapp_get_send_rate(self, account_id):
+        """Messages sent through the account by this process within SEND_RATE_WINDOW"""
+        limit = time.monotonic() - SEND_RATE_WINDOW
+        with _send_times_lock:
+            times = _send_times[account_id]
+            while times and times[0] < limit:
+                times.popleft()
+            return len(times)
+
+    def _whatsapp_record_send(self):
+        now = time.monotonic()
+        with _send_times_lock:
+            for account in self:
+                _send_times[account.id].append(now)
+
+    @api.model
+    def _whatsapp_route(self):
+        """Pick the account of a new outbound conversation.
+
+        Accounts are drawn at random, weighted by their routing weight times
+        what is left of their per minute quota, so the load spreads over all
+        the numbers and moves away from the ones close to their limit.
+        """
+        routing_table = self._whatsapp_get_routing_table()
+        # with every weight at 0 the accounts share the load evenly
+        table = [row for row in routing_table if row[1] > 0] or [
+            (account_id, 1, rate_limit) for account_id, _weight, rate_limit in routing_table
+        ]
+        if not table:
+            return self.sudo().browse()
+
+        candidates, weights = [], []
+        for account_id, weight, rate_limit in table:
+            remaining = rate_limit - self._whatsapp_get_send_rate(account_id)
+            if remaining > 0:
+                candidates.append(account_id)
+                weights.append(weight * remaining)
+        if not candidates:
+            # all numbers are at their limit, the send queue holds the messages back
+            candidates = [account_id for account_id, _weight, _limit in table]
+            weights = [weight for _account_id, weight, _limit in table]
+        return self.sudo().browse(random.choices(candidates, weights=weights)[0])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        accounts = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return accounts
+
+    def write(self, vals):
+        result = super().write(vals)
+        if ROUTING_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
+class WhatsAppTemplate(models.Model):
+    _inherit = 'whatsapp.template'
+
+    @api.model
+    def _whatsapp_get_fallback_template(self, wa_account):
+        """Approved template used outside of the session window.
+
+        The 'sale' template is preferred, then any utility template.
+        """
+        return self.sudo().browse(self._whatsapp_get_fallback_template_id(wa_account.id))
+
+    @api.model
+    @tools.ormcache('wa_account_id')
+    def _whatsapp_get_fallback_template_id(self, wa_account_id):
+        Template = self.sudo()
+        # first try to find the 'sale' template
+        template = Template.search([
+            ('name', '=', 'sale'),
+            ('status', '=', 'approved'),
+            ('wa_account_id', '=', wa_account_id)
+        ], limit=1)
+        if not template:
+            _logger.info("Sale template not found, searching for any utility template")
+            template = Template.search([
+                ('template_type', '=', 'utility'),
+                ('status', '=', 'approved'),
+                ('wa_account_id', '=', wa_account_id)
+            ], limit=1)
+        return template.id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        # only an approved template can become the fallback
+        if any(template.status == 'approved' for template in templates):
+            self.env.registry.clear_cache()
+        return templates
+
+    def write(self, vals):
+        result = super().write(vals)
+        # template syncs from Meta mostly rewrite the content
+        if FALLBACK_TEMPLATE_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
@@ -0,0 +1,146 @@
+/** @odoo-module **/
+
+/**
+ * Normalized client side store of the WhatsApp conversations.
+ *
+ * Conversations are kept by id together with a pre-parsed timestamp, and
+ * ``order`` lists their ids most recent first. Updates patch the changed
+ * fields of the stored object in place and move at most one id, instead of
+ * copying and resorting the whole list.
+ */
+export class ConversationStore {
+    constructor() {
+        this.byId = {};
+        this.order = [];
+    }
+
+    /**
+     * Milliseconds since epoch of a server datetime (naive UTC string).
+     */
+    static parseDate(value) {
+        if (!value) return 0;
+        if (value instanceof Date) return value.getTime();
+        value = String(value);
+        const hasTimezone = /(Z|[+-]\d\d:?\d\d)$/.test(value);
+        const time = Date.parse(value.replace(' ', 'T') + (hasTimezone ? '' : 'Z'));
+        return Number.isNaN(time) ? 0 : time;
+    }
+
+    get(id) {
+        return this.byId[id];
+    }
+
+    has(id) {
+        return id in this.byId;
+    }
+
+    /**
+     * Whether the conversation is part of the ordered list, and not only
+     * known from a search.
+     */
+    isListed(id) {
+        return this.order.includes(id);
+    }
+
+    list(offset = 0, limit = this.order.length) {
+        return this.order.slice(offset, offset + limit).map(id => this.byId[id]);
+    }
+
+    /**
+     * Known conversations of ``ids``, in that order.
+     */
+    pick(ids) {
+        return ids.filter(id => this.has(id)).map(id => this.byId[id]);
+    }
+
+    /**
+     * Replace the ordered list by ``conversations``, already sorted by the
+     * server. Known conversations are patched, not recreated.
+     */
+    replace(conversations) {
+        this.order = [];
+        for (const values of conversations) {
+            this._write(values);
+            this.order.push(values.id);
+        }
+    }
+
+    /**
+     * Insert or update a conversation.
+     *
+     * @param {Object} values fields to write, including the id
+     * @param {Object} [options]
+     * @param {'sorted'|'front'|'keep'|'none'} [options.position='sorted']
+     *      'sorted' places it by timestamp, 'front' first, 'keep' leaves a
+     *      known conversation where it is, 'none' keeps it out of the list
+     *      (e.g. search results)
+     * @returns {Object} the stored conversation
+     */
+    upsert(values, { position = 'sorted' } = {}) {
+        const known = this.has(values.id);
+        const previousTimestamp = known ? this.byId[values.id].timestamp : null;
+        const conversation = this._write(values);
+        if (position === 'none') {
+            return conversation;
+        }
+
+        const index = this.order.indexOf(values.id);
+        if (index !== -1) {
+            if (position === 'keep' || (position === 'sorted' && conversation.timestamp === previousTimestamp)) {
+                return conversation;
+            }
+            this.order.splice(index, 1);
+        }
+        if (position === 'front') {
+            this.order.unshift(values.id);
+        } else {
+            this.order.splice(this._sortedIndex(conversation.timestamp), 0, values.id);
+        }
+        return conversation;
+    }
+
+    /**
+     * Write ``values`` on a known conversation without moving it.
+     */
+    patch(id, values) {
+        if (!this.has(id)) return undefined;
+        return this._write({ ...values, id });
+    }
+
+    _write(values) {
+        let conversation = this.byId[values.id];
+        if (!conversation) {
+            this.byId[values.id] = { ...values };
+            conversation = this.byId[values.id];
+        } else {
+            // only assign what changed, so that only readers of it re-render
+            for (const [key, value] of Object.entries(values)) {
+                if (conversation[key] !== value) {
+                    conversation[key] = value;
+                }
+            }
+        }
+        if ('last_message_date' in values || conversation.timestamp === undefined) {
+            const timestamp = ConversationStore.parseDate(conversation.last_message_date);
+            if (conversation.timestamp !== timestamp) {
+                conversation.timestamp = timestamp;
+            }
+        }
+        return conversation;
+    }
+
+    _sortedIndex(timestamp) {
+        // binary search in the ids sorted by descending timestamp
+        let low = 0;
+        let high = this.order.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (this.byId[this.order[middle]].timestamp >= timestamp) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+}
@@ -0,0 +1,85 @@
+/** @odoo-module **/
+
+/**
+ * Adaptive polling loop.
+ *
+ * Polls at ``minInterval`` after activity and multiplies the delay by
+ * ``backoffFactor`` after each poll that brought nothing new, up to
+ * ``maxInterval``. The server can ask for a longer delay through ``hint``.
+ * The callback resolves to whether something changed.
+ */
+export class PollScheduler {
+    constructor(callback, { minInterval = 5000, maxInterval = 120000, backoffFactor = 2 } = {}) {
+        this.callback = callback;
+        this.minInterval = minInterval;
+        this.maxInterval = maxInterval;
+        this.backoffFactor = backoffFactor;
+        this.interval = minInterval;
+        // minimum delay requested by the server, in milliseconds
+        this.hint = 0;
+        this._timeout = null;
+        this._running = false;
+        this._active = false;
+    }
+
+    get nextDelay() {
+        return Math.max(this.interval, this.hint || 0);
+    }
+
+    /**
+     * @param {Object} [options]
+     * @param {boolean} [options.immediate] poll right away, at the fast pace
+     */
+    start({ immediate = false } = {}) {
+        this.stop();
+        this._active = true;
+        if (immediate) {
+            this.interval = this.minInterval;
+        }
+        this._schedule(immediate ? 0 : this.nextDelay);
+    }
+
+    stop() {
+        this._active = false;
+        if (this._timeout) {
+            clearTimeout(this._timeout);
+            this._timeout = null;
+        }
+    }
+
+    /**
+     * Something happened (new data, user action): go back to the fast pace.
+     */
+    reportActivity() {
+        const wasSlow = this.interval > this.minInterval;
+        this.interval = this.minInterval;
+        // shorten the delay already waited for
+        if (wasSlow && this._timeout) {
+            this.start();
+        }
+    }
+
+    _schedule(delay) {
+        this._timeout = setTimeout(() => this._run(), delay);
+    }
+
+    async _run() {
+        this._timeout = null;
+        if (this._running) return;
+        this._running = true;
+        try {
+            const changed = await this.callback();
+            this.interval = changed ?
+                this.minInterval : Math.min(this.interval * this.backoffFactor, this.maxInterval);
+        } catch (error) {
+            console.error("Polling error:", error);
+            this.interval = Math.min(this.interval * this.backoffFactor, this.maxInterval);
+        } finally {
+            this._running = false;
+        }
+        // stop() or start() may have been called meanwhile
+        if (this._active && !this._timeout) {
+            this._schedule(this.nextDelay);
+        }
+    }
+}
@@ -0,0 +1,180 @@
+/** @odoo-module **/
+
+/**
+ * Coordinates the WhatsApp chats opened in several tabs of one browser.
+ *
+ * A single tab is elected leader through the Web Locks API: it is the only
+ * one polling the server, and fans the results out to the other tabs over a
+ * BroadcastChannel. Every tab reports its visibility, so that the leader can
+ * pause while all of them are hidden. Only visible tabs ask for the lock, and
+ * a hidden leader hands it over as soon as another tab is visible, since the
+ * timers of hidden tabs are throttled by the browser. When the leader tab
+ * closes, the lock passes to another tab. Browsers lacking these APIs make
+ * every tab its own leader, as before.
+ */
+export class TabCoordinator {
+    constructor(name, { onMessage, onLeaderChange, onVisibilityChange, heartbeatInterval = 5000 } = {}) {
+        this.name = name;
+        this.tabId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        this.onMessage = onMessage || (() => {});
+        this.onLeaderChange = onLeaderChange || (() => {});
+        this.onVisibilityChange = onVisibilityChange || (() => {});
+        this.heartbeatInterval = heartbeatInterval;
+        this.isLeader = false;
+        // other tabs: id -> { visible, lastSeen }
+        this.tabs = new Map();
+        this._channel = null;
+        this._heartbeat = null;
+        this._lockAbort = null;
+        this._releaseLock = null;
+        this._onChannelMessage = this._onChannelMessage.bind(this);
+        this._onDocumentVisibilityChange = this._onDocumentVisibilityChange.bind(this);
+    }
+
+    get isSupported() {
+        return typeof BroadcastChannel !== 'undefined' && Boolean(navigator.locks);
+    }
+
+    /**
+     * Whether at least one tab of the browser is visible.
+     */
+    get anyVisible() {
+        if (!document.hidden) return true;
+        const now = Date.now();
+        for (const [tabId, tab] of this.tabs) {
+            // tabs that stopped sending heartbeats are gone
+            if (now - tab.lastSeen > this.heartbeatInterval * 3) {
+                this.tabs.delete(tabId);
+            } else if (tab.visible) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    start() {
+        document.addEventListener('visibilitychange', this._onDocumentVisibilityChange);
+        if (!this.isSupported) {
+            this._setLeader(true);
+            return;
+        }
+
+        this._channel = new BroadcastChannel(this.name);
+        this._channel.addEventListener('message', this._onChannelMessage);
+        this._announce();
+        this._heartbeat = setInterval(() => this._announce(), this.heartbeatInterval);
+        this._updateLockRequest();
+    }
+
+    stop() {
+        document.removeEventListener('visibilitychange', this._onDocumentVisibilityChange);
+        clearInterval(this._heartbeat);
+        this._heartbeat = null;
+        if (this._channel) {
+            this._post({ type: 'leave' });
+            this._channel.removeEventListener('message', this._onChannelMessage);
+            this._channel.close();
+            this._channel = null;
+        }
+        this._abortLockRequest();
+        if (this._releaseLock) {
+            this._releaseLock();
+            this._releaseLock = null;
+        }
+        this.isLeader = false;
+    }
+
+    /**
+     * Send data to the other tabs, received through ``onMessage``.
+     */
+    broadcast(type, payload) {
+        this._post({ type: 'data', dataType: type, payload });
+    }
+
+    /**
+     * Ask for the lock while this tab is visible, stop asking while it is
+     * hidden, and give it up when hidden while another tab is visible.
+     */
+    _updateLockRequest() {
+        if (!this._channel) return;
+        if (!document.hidden) {
+            if (!this.isLeader && !this._lockAbort) {
+                this._requestLock();
+            }
+        } else if (this.isLeader) {
+            if (this.anyVisible) {
+                this._releaseLeadership();
+            }
+        } else {
+            this._abortLockRequest();
+        }
+    }
+
+    _requestLock() {
+        // the lock is held until released or the tab closes
+        const lockAbort = new AbortController();
+        this._lockAbort = lockAbort;
+        navigator.locks.request(this.name, { signal: lockAbort.signal }, () => new Promise((resolve) => {
+            if (this._lockAbort === lockAbort) {
+                this._lockAbort = null;
+            }
+            this._releaseLock = resolve;
+            this._setLeader(true);
+            // the tab may have been hidden while waiting
+            this._updateLockRequest();
+        })).catch(() => {
+            // aborted before the lock was granted
+        });
+    }
+
+    _abortLockRequest() {
+        if (this._lockAbort) {
+            this._lockAbort.abort();
+            this._lockAbort = null;
+        }
+    }
+
+    _releaseLeadership() {
+        if (this._releaseLock) {
+            this._releaseLock();
+            this._releaseLock = null;
+        }
+        this._setLeader(false);
+    }
+
+    _setLeader(isLeader) {
+        if (this.isLeader === isLeader) return;
+        this.isLeader = isLeader;
+        this.onLeaderChange(isLeader);
+    }
+
+    _post(message) {
+        this._channel?.postMessage({ ...message, tabId: this.tabId });
+    }
+
+    _announce() {
+        this._post({ type: 'tab', visible: !document.hidden });
+    }
+
+    _onChannelMessage({ data }) {
+        if (!data || data.tabId === this.tabId) return;
+        if (data.type === 'tab') {
+            const wasVisible = this.anyVisible;
+            this.tabs.set(data.tabId, { visible: data.visible, lastSeen: Date.now() });
+            if (this.anyVisible !== wasVisible) {
+                this.onVisibilityChange(!wasVisible);
+            }
+            this._updateLockRequest();
+        } else if (data.type === 'leave') {
+            this.tabs.delete(data.tabId);
+        } else if (data.type === 'data') {
+            this.onMessage(data.dataType, data.payload);
+        }
+    }
+
+    _onDocumentVisibilityChange() {
+        this._announce();
+        this._updateLockRequest();
+        this.onVisibilityChange(this.anyVisible);
+    }
+}
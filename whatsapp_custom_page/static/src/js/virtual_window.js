@@ -0,0 +1,89 @@
+/** @odoo-module **/
+
+/**
+ * Windowed rendering of long lists whose rows have variable heights.
+ *
+ * Only the rows around the viewport (plus a buffer on each side) are
+ * mounted; the space of the other rows is kept with top and bottom paddings
+ * computed from the measured heights, or an estimate for rows never shown.
+ */
+export class VirtualWindow {
+    constructor({ estimatedHeight = 80, buffer = 10 } = {}) {
+        this.estimatedHeight = estimatedHeight;
+        this.buffer = buffer;
+        this.heights = new Map();
+    }
+
+    reset() {
+        this.heights.clear();
+    }
+
+    heightOf(key) {
+        return this.heights.get(key) ?? this.estimatedHeight;
+    }
+
+    totalHeight(keys, start = 0, end = keys.length) {
+        let height = 0;
+        for (let i = start; i < end; i++) {
+            height += this.heightOf(keys[i]);
+        }
+        return height;
+    }
+
+    /**
+     * Store the heights of the rows currently mounted in ``listEl``.
+     * Rows are identified by their ``data-key`` attribute; the distance to
+     * the next row is used so that margins are accounted for.
+     *
+     * @returns {boolean} whether a height changed
+     */
+    measure(listEl) {
+        const rows = listEl.querySelectorAll(':scope > [data-key]');
+        let changed = false;
+        rows.forEach((row, index) => {
+            const next = rows[index + 1];
+            const height = next ? next.offsetTop - row.offsetTop : row.offsetHeight;
+            const key = Number(row.dataset.key) || row.dataset.key;
+            if (height > 0 && this.heights.get(key) !== height) {
+                this.heights.set(key, height);
+                changed = true;
+            }
+        });
+        return changed;
+    }
+
+    /**
+     * Rows to mount for the given scroll position.
+     *
+     * @param {Array} keys row keys, in display order
+     * @param {number} scrollTop may exceed the list height to show its end
+     * @param {number} viewportHeight
+     * @returns {{start: number, end: number, paddingTop: number, paddingBottom: number}}
+     */
+    compute(keys, scrollTop, viewportHeight) {
+        const total = this.totalHeight(keys);
+        scrollTop = Math.max(0, Math.min(scrollTop, total - viewportHeight));
+
+        let start = 0;
+        let offset = 0;
+        while (start < keys.length && offset + this.heightOf(keys[start]) <= scrollTop) {
+            offset += this.heightOf(keys[start]);
+            start++;
+        }
+        let end = start;
+        let bottom = offset;
+        while (end < keys.length && bottom < scrollTop + viewportHeight) {
+            bottom += this.heightOf(keys[end]);
+            end++;
+        }
+
+        start = Math.max(0, start - this.buffer);
+        end = Math.min(keys.length, end + this.buffer);
+        return {
+            start,
+            end,
+            paddingTop: this.totalHeight(keys, 0, start),
+            paddingBottom: this.totalHeight(keys, end),
+        };
+    }
+}
@@ -1,18 +1,24 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component, onWillStart, onMounted, onWillUnmount, useRef, useState } from "@odoo/owl";
+import { Component, onWillStart, onMounted, onPatched, onWillUnmount, useRef, useState } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
+import { debounce } from "@web/core/utils/timing";
 import { formatDateTime, deserializeDateTime } from "@web/core/l10n/dates";
 import { Pager } from "@web/core/pager/pager";
 import { Dialog } from "@web/core/dialog/dialog";
 import { _t } from "@web/core/l10n/translation";
+import { VirtualWindow } from "./virtual_window";
+import { ConversationStore } from "./conversation_store";
+import { TabCoordinator } from "./tab_coordinator";
+import { PollScheduler } from "./poll_scheduler";
 
 class WhatsAppChat extends Component {
     setup() {
         this.rpc = useService("rpc");
         this.user = useService("user");
         this.dialogService = useService("dialog");
+        this.busService = useService("bus_service");
         
         // initialize refs
         this.messageContainerRef = useRef("messageContainer");
@@ -23,6 +29,9 @@ class WhatsAppChat extends Component {
         this.audioContext = null;
         this.mediaRecorder = null;
         this.audioChunks = [];
+        // files larger than this are uploaded in resumable chunks
+        this.chunkedUploadThreshold = 8 * 1024 * 1024;
+        this.chunkedUploadMaxRetries = 5;
 
         // format message helper
         this.formatMessageBody = (body) => {
@@ -73,8 +82,10 @@ class WhatsAppChat extends Component {
         };
 
         // use reactive state
+        // conversations by id, most recent first, see ConversationStore
+        this.conversations = useState(new ConversationStore());
+
         this.state = useState({
-            conversations: [],
             filteredConversations: [],
             displayedConversations: [],
             selectedConversation: null,
@@ -82,6 +93,10 @@ class WhatsAppChat extends Component {
             loading: false,
             error: null,
             searchQuery: '',
+            // server side search results, paginated on their own
+            searchOffset: 0,
+            searchTotal: 0,
+            searching: false,
             userInfo: {
                 name: this.user.name || 'User',
                 avatarUrl: this._getUserAvatarUrl(this.user.userId)
@@ -91,36 +106,77 @@ class WhatsAppChat extends Component {
             offset: 0,
             total: 0,
             currentPage: 1,
-            messageOffset: 0,
             messageLimit: 50,
-            messageTotal: 0,
+            // keyset pagination of the open chat, see /whatsapp/messages
+            messageHasMore: false,
+            // scroll position the mounted window of messages was computed for
+            messageScrollTop: 0,
+            messageViewportHeight: 800,
             isRecording: false,
             recordingDuration: 0
         });
 
-        this.messagePollingInterval = 5000; // 5 seconds
-        this._pollTimeout = null;
+        // fast after activity, backing off to 2 minutes while nothing changes
+        this.pollScheduler = new PollScheduler(() => this._poll(), {
+            minInterval: 5000,
+            maxInterval: 120000,
+        });
+        // server cursor of the delta sync, see /whatsapp/sync
+        this.syncCursor = null;
+        // ids of the conversation page loaded last, in the server order
+        this.pageIds = [];
+
+        // bus notifications replace polling while the websocket is up
+        this.busConnected = false;
+        this._onBusMessage = this._onBusMessage.bind(this);
+        this._onBusStatus = this._onBusStatus.bind(this);
+        this._onBusUnread = this._onBusUnread.bind(this);
+        this._onBusConnect = this._onBusConnect.bind(this);
+        this._onBusDisconnect = this._onBusDisconnect.bind(this);
+
+        // one search request per pause in typing, stale responses are dropped
+        this.searchDebounceDelay = 300;
+        this._searchSequence = 0;
+        this._searchRequest = null;
+        this._debouncedSearch = debounce(() => this._searchConversations(), this.searchDebounceDelay);
+
+        // one tab of the browser polls and shares the results with the others
+        this.tabCoordinator = new TabCoordinator("whatsapp_custom_page.poller", {
+            onMessage: (type, payload) => this._onTabMessage(type, payload),
+            onLeaderChange: () => this._startPolling(),
+            // coming back to a tab refreshes right away
+            onVisibilityChange: (visible) => this._startPolling({ immediate: visible }),
+        });
+
+        // only the bubbles around the viewport are mounted
+        this.virtualMessages = new VirtualWindow({ estimatedHeight: 80, buffer: 15 });
+        this._messageRange = null;
+        // message kept at the same place on screen across the next patch
+        this._scrollAnchor = null;
+        this._stickToBottom = false;
+        this._scrollFrame = null;
 
         onWillStart(async () => {
+            await this._resetSyncCursor();
             await this._loadConversations();
         });
 
+        onPatched(() => this._onMessagesPatched());
+
         onMounted(() => {
+            this._subscribeBus();
+            this.tabCoordinator.start();
             this._startPolling();
-            // add event listener for search input
-            const searchInput = document.querySelector('.o_whatsapp_search_input');
-            if (searchInput) {
-                searchInput.addEventListener('input', this._onSearch.bind(this));
-            }
         });
 
         onWillUnmount(() => {
-            this._stopPolling();
-            //remove event listener
-            const searchInput = document.querySelector('.o_whatsapp_search_input');
-            if (searchInput) {
-                searchInput.removeEventListener('input', this._onSearch.bind(this));
+            if (this._scrollFrame) {
+                cancelAnimationFrame(this._scrollFrame);
             }
+            this._stopPolling();
+            this.tabCoordinator.stop();
+            this._unsubscribeBus();
+            this._cancelSearch();
         });
 
         // clear message input helper
@@ -140,16 +196,26 @@ class WhatsAppChat extends Component {
     // --------------------------------------------------------------------------
 
     _updatePaging() {
-        const conversations = this.state.searchQuery ? 
-            this.state.filteredConversations : 
-            this.state.conversations;
-
-        const start = this.state.offset;
-        const end = Math.min(start + this.state.limit, conversations.length);
-        this.state.displayedConversations = conversations.slice(start, end);
+        // search results already are a single server page
+        if (this.state.searchQuery) {
+            this.state.displayedConversations = this.state.filteredConversations;
+            return;
+        }
+        if (this.state.offset === 0) {
+            this.state.displayedConversations = this.conversations.list(0, this.state.limit);
+        } else {
+            // only the pages loaded so far are in the store, so its order
+            // cannot be sliced at the offset of a later page
+            this.state.displayedConversations = this.conversations.pick(this.pageIds);
+        }
     }
 
     async _onPagerChanged({ offset }) {
+        if (this.state.searchQuery) {
+            this.state.searchOffset = offset;
+            await this._searchConversations();
+            return;
+        }
         if (this.state.loading) return;
         
         this.state.offset = offset;
@@ -162,23 +228,48 @@ class WhatsAppChat extends Component {
     // private
     // --------------------------------------------------------------------------
 
+    // avatars are revalidated with their etag instead of being refetched on every render
     _getUserAvatarUrl(userId) {
         return userId ? 
-            `/web/image/res.users/${userId}/avatar_128?unique=${Date.now()}` : 
+            `/web/image/res.users/${userId}/avatar_128` : 
             '/whatsapp_custom_page/static/src/img/default_avatar.png';
     }
 
     _getPartnerAvatarUrl(partnerId) {
         return partnerId ? 
-            `/web/image/res.partner/${partnerId}/avatar_128?unique=${Date.now()}` : 
+            `/web/image/res.partner/${partnerId}/avatar_128` : 
             '/whatsapp_custom_page/static/src/img/default_avatar.png';
     }
 
-    async _loadConversations() {
+    _getAttachmentThumbnailUrl(attachment) {
+        if (attachment.thumbnail_url) {
+            return attachment.thumbnail_url;
+        }
+        return attachment.mimetype && attachment.mimetype.startsWith('image/') ?
+            `/web/image/${attachment.id}/256x256?unique=${attachment.checksum || ''}` : false;
+    }
+
+    _getAttachmentPreviewUrl(attachment) {
+        if (attachment.preview_url) {
+            return attachment.preview_url;
+        }
+        const route = attachment.mimetype && attachment.mimetype.startsWith('image/') ? 'image' : 'content';
+        return `/web/${route}/${attachment.id}?unique=${attachment.checksum || ''}`;
+    }
+
+    /**
+     * Load a page of conversations, the current one by default.
+     *
+     * @param {Object} [options]
+     * @param {number} [options.offset] page to load, another page than the
+     *      displayed one only refreshes the store
+     * @param {boolean} [options.share=false] send the page to the other tabs
+     */
+    async _loadConversations({ offset = this.state.offset, share = false } = {}) {
         try {
             this.state.loading = true;
             const result = await this.rpc("/whatsapp/conversations", {
-                offset: this.state.offset,
+                offset: offset,
                 limit: this.state.limit,
                 minimal: false,
                 sort_by_last_message: true,
@@ -187,59 +278,16 @@ class WhatsAppChat extends Component {
             if (result.error) {
                 this.state.error = result.error;
             } else {
-                // update pagination state
-                this.state.total = result.total_count || 0;
-                this.state.offset = result.offset || 0;
-                this.state.limit = result.limit || 20;
-
-                // group and sort conversations by last message date
-                const groupedConversations = this._groupConversationsByContact(result.conversations || []);
-                
-                // sort conversations by last_message_date in descending order
-                const sortedConversations = groupedConversations.sort((a, b) => {
-                    const dateA = new Date(a.last_message_date || 0);
-                    const dateB = new Date(b.last_message_date || 0);
-                    return dateB - dateA;
-                });
-                
-                // update the conversations lists
-                if (this.state.offset === 0) {
-                    // First page - replace all conversations
-                    this.state.conversations = sortedConversations;
-                } else {
-                    // get existing conversations excluding the ones about to add
-                    const existingConvIds = new Set(sortedConversations.map(conv => conv.id));
-                    const existingConversations = this.state.conversations.filter(
-                        conv => !existingConvIds.has(conv.id)
-                    );
-                    
-                    // merge and resort all conversations
-                    this.state.conversations = [...existingConversations, ...sortedConversations]
-                        .sort((a, b) => {
-                            const dateA = new Date(a.last_message_date || 0);
-                            const dateB = new Date(b.last_message_date || 0);
-                            return dateB - dateA;
-                        });
-                }
-                
-                // update filtered and displayed conversations
-                if (this.state.searchQuery) {
-                    this._applySearchFilter(this.state.searchQuery);
-                } else {
-                    this.state.filteredConversations = this.state.conversations;
-                    this._updatePaging();
+                if (offset === this.state.offset) {
+                    // the server may have moved the page
+                    this.state.offset = result.offset || 0;
                 }
-                this.state.error = null;
-
-                // if there's a selected conversation reload its messages
-                if (this.state.selectedConversation) {
-                    const updatedConv = this.state.conversations.find(
-                        conv => conv.id === this.state.selectedConversation.id
-                    );
-                    if (updatedConv) {
-                        await this._loadMessages(updatedConv);
-                    }
+                this._applyConversationPage(result);
+                if (share) {
+                    // the other tabs take it instead of all loading it again
+                    this.tabCoordinator.broadcast("page", result);
                 }
+                await this._refreshSelectedConversation();
             }
         } catch (error) {
             this.state.error = "Failed to load conversations";
@@ -249,66 +297,72 @@ class WhatsAppChat extends Component {
         }
     }
 
-    _groupConversationsByContact(conversations) {
-        // create a map to group conversations
-        const groupedMap = new Map();
+    /**
+     * Store a page of /whatsapp/conversations, loaded by this tab or shared
+     * by the leader tab.
+     */
+    _applyConversationPage(result) {
+        const offset = result.offset || 0;
+        const conversations = (result.conversations || []).map(conv => this._prepareConversation(conv));
+        if (offset === 0) {
+            // first page, the server order is authoritative
+            this.conversations.replace(conversations);
+        } else {
+            // merge the page into the rows already known
+            for (const conv of conversations) {
+                this.conversations.upsert(conv);
+            }
+        }
+        // update pagination state
+        this.state.total = result.total_count || 0;
+        if (offset === this.state.offset) {
+            this.state.limit = result.limit || 20;
+            this.pageIds = conversations.map(conv => conv.id);
+        }
 
-        conversations.forEach(conv => {
-            const key = `${conv.id}-${conv.partner_id || ''}-${conv.phone || ''}`;
-            // check if message is sent by current user
-            const isSentMessage = conv.last_message_author_id === this.user.partnerId;
-            
-            if (!groupedMap.has(key)) {
-                // initialize new conversation with proper sent status and unread count
-                groupedMap.set(key, {
-                    ...conv,
-                    messages: [conv],
-                    last_message: this._formatMessageBody(conv.last_message),
-                    total_unread: isSentMessage ? 0 : (conv.unread_count || 0),
-                    last_message_date: conv.last_message_date || conv.create_date || new Date().toISOString(),
-                    is_sent: isSentMessage,
-                    unread_count: isSentMessage ? 0 : (conv.unread_count || 0)
-                });
-            } else {
-                const existing = groupedMap.get(key);
-                existing.messages.push(conv);
-                
-                // update last message if newer
-                const existingDate = new Date(existing.last_message_date || 0);
-                const currentDate = new Date(conv.last_message_date || conv.create_date || 0);
-                
-                if (currentDate > existingDate) {
-                    existing.last_message = this._formatMessageBody(conv.last_message);
-                    existing.last_message_date = conv.last_message_date || conv.create_date;
-                    existing.last_message_author_id = conv.last_message_author_id;
-                    existing.is_sent = isSentMessage;
-                    
-                    // only update unread counts if the message is not sent by the current user
-                    if (isSentMessage) {
-                        existing.total_unread = 0;
-                        existing.unread_count = 0;
-                    } else {
-                        existing.total_unread = conv.unread_count || 0;
-                        existing.unread_count = conv.unread_count || 0;
-                    }
-                }
+        // update displayed conversations
+        this._updatePaging();
+        this.state.error = null;
+    }
+
+    async _refreshSelectedConversation() {
+        // if there's a selected conversation fetch what it is missing
+        if (this.state.selectedConversation) {
+            const updatedConv = this.conversations.get(this.state.selectedConversation.id);
+            if (updatedConv) {
+                await this._loadNewMessages(updatedConv);
             }
-        });
+        }
+    }
 
-        return Array.from(groupedMap.values());
+    _prepareConversation(conv) {
+        // check if message is sent by current user
+        const isSentMessage = conv.last_message_author_id === this.user.partnerId;
+        const unreadCount = isSentMessage ? 0 : (conv.unread_count || 0);
+        return {
+            ...conv,
+            last_message: this._formatMessageBody(conv.last_message),
+            last_message_date: conv.last_message_date || conv.create_date || new Date().toISOString(),
+            is_sent: isSentMessage,
+            unread_count: unreadCount,
+            total_unread: unreadCount,
+        };
     }
 
-    async _loadMessages(conversation) {
+    async _loadMessages(conversation, { beforeId = null } = {}) {
         if (!conversation) return;
 
         try {
             this.state.loading = true;
             const result = await this.rpc("/whatsapp/messages", {
                 channel_id: conversation.id,
-                offset: this.state.messageOffset || 0,
+                before_id: beforeId,
                 limit: this.state.messageLimit || 50,
+                with_count: false,
                 include_mail_messages: true
             });
+            // the user switched to another chat meanwhile
+            if (this.state.selectedConversation?.id !== conversation.id) return;
             if (result.error) {
                 this.state.error = result.error;
             } else {
@@ -318,60 +372,36 @@ class WhatsAppChat extends Component {
 
                 // update conversation immediately to prevent badge flicker
                 if (isSentMessage) {
-                    const updatedConversations = this.state.conversations.map(conv => {
-                        if (conv.id === conversation.id) {
-                            return {
-                                ...conv,
-                                unread_count: 0,
-                                total_unread: 0,
-                                is_sent: true,
-                                last_message_author_id: this.user.partnerId
-                            };
-                        }
-                        return conv;
+                    this.conversations.patch(conversation.id, {
+                        unread_count: 0,
+                        total_unread: 0,
+                        is_sent: true,
+                        last_message_author_id: this.user.partnerId
                     });
-                    this.state.conversations = updatedConversations;
-                    this._updatePaging();
                 }
 
-                // format message bodies and determine direction
-                const formattedMessages = (result.messages || []).map(msg => ({
-                    ...msg,
-                    body: this._formatMessageBody(msg.body),
-                    direction: msg.author_id === this.user.partnerId ? 'outbound' : 'inbound',
-                    is_whatsapp: msg.is_whatsapp || false,
-                    is_sent: msg.author_id === this.user.partnerId
-                }));
-
-                // sort messages by date
-                formattedMessages.sort((a, b) => {
-                    const dateA = new Date(a.create_date || 0);
-                    const dateB = new Date(b.create_date || 0);
-                    return dateA - dateB;
-                });
+                const formattedMessages = this._formatMessages(result.messages || []);
 
                 // update pagination info
-                this.state.messageTotal = result.total_count;
-                this.state.messageOffset = result.offset;
+                this.state.messageHasMore = Boolean(result.has_more);
                 this.state.messageLimit = result.limit;
 
                 // append or prepend messages based on the current state
-                if (this.state.messageOffset === 0) {
+                if (!beforeId) {
                     this.state.messages = formattedMessages;
-                    setTimeout(() => this._scrollToBottom(), 100);
+                    this._scrollToBottom();
                 } else {
-                    const previousScrollHeight = this.messageContainerRef.el?.scrollHeight || 0;
-                    this.state.messages = [...formattedMessages, ...this.state.messages];
-                    setTimeout(() => {
-                        if (this.messageContainerRef.el) {
-                            const newScrollHeight = this.messageContainerRef.el.scrollHeight;
-                            this.messageContainerRef.el.scrollTop = newScrollHeight - previousScrollHeight;
-                        }
-                    }, 100);
+                    // skip messages already shown, e.g. received while scrolling back
+                    const knownIds = new Set(this.state.messages.map(msg => msg.id));
+                    const olderMessages = formattedMessages.filter(msg => !knownIds.has(msg.id));
+                    this._anchorScroll();
+                    // keep the window on the same messages, the anchor fixes the rest
+                    this.state.messageScrollTop += this.virtualMessages.totalHeight(olderMessages.map(msg => msg.id));
+                    this.state.messages = [...olderMessages, ...this.state.messages];
                 }
 
                 // update conversation with latest message if available
-                if (formattedMessages.length > 0) {
+                if (!beforeId && formattedMessages.length > 0) {
                     const latestMessage = formattedMessages[formattedMessages.length - 1];
                     const isSentMessage = latestMessage.author_id === this.user.partnerId;
                     
@@ -399,8 +429,60 @@ class WhatsAppChat extends Component {
         }
     }
 
+    _formatMessages(messages) {
+        // format message bodies and determine direction
+        const formattedMessages = messages.map(msg => ({
+            ...msg,
+            body: this._formatMessageBody(msg.body),
+            direction: msg.author_id === this.user.partnerId ? 'outbound' : 'inbound',
+            is_whatsapp: msg.is_whatsapp || false,
+            is_sent: msg.author_id === this.user.partnerId
+        }));
+
+        // oldest first, ids grow with time
+        return formattedMessages.sort((a, b) => a.id - b.id);
+    }
+
+    /**
+     * Fetch only the messages of the open chat newer than the ones shown,
+     * and only when the last message of the conversation is not one of them.
+     */
+    async _loadNewMessages(conversation) {
+        const newestId = Math.max(0, ...this.state.messages.filter(msg => msg.id).map(msg => msg.id));
+        if (!newestId) {
+            await this._loadMessages(conversation);
+            return;
+        }
+        if (!conversation.last_message_id || conversation.last_message_id <= newestId) return;
+
+        try {
+            const result = await this.rpc("/whatsapp/messages", {
+                channel_id: conversation.id,
+                after_id: newestId,
+                limit: this.state.messageLimit || 50,
+                with_count: false,
+            });
+            if (this.state.selectedConversation?.id !== conversation.id || result.error) return;
+            if (result.has_more) {
+                // too many new messages, start over from the latest page
+                await this._loadMessages(conversation);
+                return;
+            }
+            const knownIds = new Set(this.state.messages.map(msg => msg.id));
+            const newMessages = this._formatMessages(result.messages || []).filter(msg => !knownIds.has(msg.id));
+            if (newMessages.length) {
+                this.state.messages = [...this.state.messages, ...newMessages];
+                this._scrollToBottom(true);
+            }
+        } catch (error) {
+            console.error("Error loading new messages:", error);
+        }
+    }
+
     async _sendMessage(message, attachmentIds = []) {
         if (!this.state.selectedConversation) return;
+        // a reply is likely to come soon
+        this._reportActivity();
         
         try {
             // format message body before sending
@@ -423,37 +505,18 @@ class WhatsAppChat extends Component {
             };
 
             // update conversation immediately to prevent badge flicker
-            const updatedConv = {
-                ...this.state.selectedConversation,
+            const updatedValues = {
                 last_message: message,
                 last_message_date: newMessage.create_date,
                 last_message_author_id: this.user.partnerId,
                 unread_count: 0,
                 total_unread: 0,
-                is_sent: true,
-                messages: [...(this.state.selectedConversation.messages || []), newMessage]
+                is_sent: true
             };
-
-            // update all conversation lists immediately to prevent badge flicker
-            const updatedConversations = this.state.conversations.map(conv => {
-                if (conv.id === updatedConv.id) {
-                    return {
-                        ...conv,
-                        last_message: message,
-                        last_message_date: newMessage.create_date,
-                        last_message_author_id: this.user.partnerId,
-                        unread_count: 0,
-                        total_unread: 0,
-                        is_sent: true
-                    };
-                }
-                return conv;
-            });
-            this.state.conversations = updatedConversations;
-            this._updatePaging();
+            const updatedConv = this.conversations.patch(this.state.selectedConversation.id, updatedValues);
 
             // update the selected conversation
-            this.state.selectedConversation = updatedConv;
+            this.state.selectedConversation = updatedConv || { ...this.state.selectedConversation, ...updatedValues };
 
             // add message to messages list immediately
             this.state.messages = [...this.state.messages, newMessage];
@@ -503,13 +566,6 @@ class WhatsAppChat extends Component {
     }
 
     _updateConversationOrder(updatedConv, maintainReadStatus = false, moveToFirstPage = true) {
-        // find the conversation in the current list
-        const conversations = [...this.state.conversations];
-        const index = conversations.findIndex(conv => 
-            conv.id === updatedConv.id || 
-            (conv.partner_id === updatedConv.partner_id && conv.phone === updatedConv.phone)
-        );
-
         // always ensure sent messages have no unread count
         if (updatedConv.last_message_author_id === this.user.partnerId || updatedConv.is_sent) {
             updatedConv = {
@@ -520,82 +576,291 @@ class WhatsAppChat extends Component {
             };
         }
 
+        // for new messages move it by date, so that updates sent again by the
+        // sync do not bring older conversations up; for just viewing update in place
+        const conversation = this.conversations.upsert(updatedConv, {
+            position: moveToFirstPage ? 'sorted' : 'keep',
+        });
         if (moveToFirstPage) {
-            // for new messages remove from current position and add to beginning
-            if (index !== -1) {
-                conversations.splice(index, 1);
-            }
-            conversations.unshift(updatedConv);
-
             // reset to first page
             this.state.offset = 0;
             this.state.currentPage = 1;
-        } else {
-            // for just viewing update in place without changing position
-            if (index !== -1) {
-                conversations[index] = updatedConv;
-            }
         }
-
-        // update state
-        this.state.conversations = conversations;
         this._updatePaging();
 
         // if this is the selected conversation update its messages
-        if (this.state.selectedConversation && 
-            (this.state.selectedConversation.id === updatedConv.id || 
-             (this.state.selectedConversation.partner_id === updatedConv.partner_id && 
-              this.state.selectedConversation.phone === updatedConv.phone))) {
-            this.state.selectedConversation = updatedConv;
+        if (this.state.selectedConversation?.id === conversation.id) {
+            this.state.selectedConversation = conversation;
         }
     }
 
-    _startPolling() {
+    _startPolling({ immediate = false } = {}) {
         // clear any existing polling
         this._stopPolling();
-        
-        // prevent start polling if it already disabled
-        if (!this.messagePollingInterval) return;
-        
-        this._pollTimeout = setTimeout(async () => {
+
+        // updates are pushed through the bus, polling is only a fallback
+        if (this.busConnected) return;
+
+        // another tab polls for us, and nobody needs updates while all tabs are hidden
+        if (!this.tabCoordinator.isLeader || !this.tabCoordinator.anyVisible) return;
+
+        this.pollScheduler.start({ immediate });
+    }
+
+    /**
+     * @returns {Promise<boolean>} whether something changed
+     */
+    async _poll() {
+        if (!this.syncCursor) {
+            await this._resetSyncCursor();
+            if (!this.syncCursor) {
+                // the server is still failing, keep backing off
+                return false;
+            }
+            await this._loadConversations({ offset: 0, share: true });
+            return true;
+        }
+
+        const result = await this.rpc("/whatsapp/sync", { cursor: this.syncCursor });
+        // the server may ask every client to slow down
+        this.pollScheduler.hint = result.poll_interval || 0;
+        if (result.error) {
+            // back off instead of reloading everything at the fastest pace
+            throw new Error(result.error);
+        }
+        if (result.has_more) {
+            // too far behind for a delta, start over from the first page
+            await this._resetSyncCursor();
+            await this._loadConversations({ offset: 0, share: true });
+            return true;
+        }
+
+        this._applySync(result);
+        this.tabCoordinator.broadcast("sync", result);
+        return Boolean(result.conversations?.length || result.messages?.length || result.statuses?.length);
+    }
+
+    _onTabMessage(type, payload) {
+        // results of the poll of the leader tab
+        if (type === "sync") {
+            this._applySync(payload);
+        } else if (type === "page") {
+            this._applyConversationPage(payload);
+            this._refreshSelectedConversation();
+        } else if (type === "activity") {
+            this.pollScheduler.reportActivity();
+        }
+    }
+
+    _reportActivity() {
+        // the leader tab may be another one
+        this.pollScheduler.reportActivity();
+        this.tabCoordinator.broadcast("activity");
+    }
+
+    _applySync(result) {
+        this.syncCursor = result.cursor;
+        this._applyConversationUpdates(result.conversations || []);
+        for (const message of result.messages || []) {
+            this._appendOpenChatMessage(message.channel_id, message);
+        }
+        for (const { channel_id, message_id, status } of result.statuses || []) {
+            this._onBusStatus({ channel_id, statuses: [{ message_id, status }] });
+        }
+    }
+
+    async _resetSyncCursor() {
+        try {
+            const result = await this.rpc("/whatsapp/sync", {});
+            this.syncCursor = result.error ? null : result.cursor;
+        } catch (error) {
+            this.syncCursor = null;
+            console.error("Error initializing sync cursor:", error);
+        }
+    }
+
+    _applyConversationUpdates(conversations) {
+        for (const values of conversations) {
+            const conv = this._prepareConversation(values);
+            if (!this.conversations.isListed(conv.id)) {
+                // the delta carries the whole entry, new conversations only
+                // appear on the first page
+                if (this.state.offset === 0 && !this.state.searchQuery) {
+                    this.conversations.upsert(conv);
+                    this.state.total += 1;
+                    this._updatePaging();
+                }
+                continue;
+            }
+            const isOpen = this.state.selectedConversation?.id === conv.id;
+            this._updateConversationOrder({
+                ...conv,
+                unread_count: isOpen ? 0 : conv.unread_count,
+                total_unread: isOpen ? 0 : conv.total_unread,
+            }, true, this.state.offset === 0);
+        }
+    }
+
+    _appendOpenChatMessage(channelId, message) {
+        if (this.state.selectedConversation?.id !== channelId) return;
+        if (this.state.messages.some(msg => msg.id === message.id)) return;
+
+        const isSentMessage = message.author_id === this.user.partnerId;
+        // an optimistic bubble for our own message is replaced by the server response
+        if (isSentMessage && this.state.messages.some(msg => !msg.id)) return;
+
+        this.state.messages = [...this.state.messages, {
+            ...message,
+            body: this._formatMessageBody(message.body),
+            direction: isSentMessage ? 'outbound' : 'inbound',
+            is_sent: isSentMessage,
+        }];
+        this._scrollToBottom(true);
+    }
+
+    _stopPolling() {
+        this.pollScheduler.stop();
+    }
+
+    // --------------------------------------------------------------------------
+    // bus
+    // --------------------------------------------------------------------------
+
+    _subscribeBus() {
+        this.busService.subscribe("whatsapp_custom_page/message", this._onBusMessage);
+        this.busService.subscribe("whatsapp_custom_page/status", this._onBusStatus);
+        this.busService.subscribe("whatsapp_custom_page/unread", this._onBusUnread);
+        this.busService.addEventListener("connect", this._onBusConnect);
+        this.busService.addEventListener("reconnect", this._onBusConnect);
+        this.busService.addEventListener("disconnect", this._onBusDisconnect);
+        this.busService.addEventListener("reconnecting", this._onBusDisconnect);
+        this.busConnected = Boolean(this.busService.isActive);
+    }
+
+    _unsubscribeBus() {
+        this.busService.unsubscribe("whatsapp_custom_page/message", this._onBusMessage);
+        this.busService.unsubscribe("whatsapp_custom_page/status", this._onBusStatus);
+        this.busService.unsubscribe("whatsapp_custom_page/unread", this._onBusUnread);
+        this.busService.removeEventListener("connect", this._onBusConnect);
+        this.busService.removeEventListener("reconnect", this._onBusConnect);
+        this.busService.removeEventListener("disconnect", this._onBusDisconnect);
+        this.busService.removeEventListener("reconnecting", this._onBusDisconnect);
+    }
+
+    async _onBusConnect() {
+        const wasConnected = this.busConnected;
+        this.busConnected = true;
+        this._stopPolling();
+        // catch up on what happened while the bus was down, once for all tabs
+        if (!wasConnected && this.tabCoordinator.isLeader) {
             try {
-                await this._loadConversations();  // use _loadConversations instead of _poll
+                await this._poll();
             } catch (error) {
-                console.error("Polling error:", error);
-            } finally {
-                // schedule next poll
-                this._pollTimeout = setTimeout(() => this._startPolling(), this.messagePollingInterval);
+                console.error("Error catching up after reconnecting:", error);
             }
-        }, this.messagePollingInterval);
+        }
     }
 
-    _stopPolling() {
-        if (this._pollTimeout) {
-            clearTimeout(this._pollTimeout);
-            this._pollTimeout = null;
+    _onBusDisconnect() {
+        if (!this.busConnected) return;
+        this.busConnected = false;
+        this._startPolling();
+    }
+
+    _onBusMessage({ channel_id, message, last_message }) {
+        const isSentMessage = message.author_id === this.user.partnerId;
+        const isOpen = this.state.selectedConversation?.id === channel_id;
+        const conversation = this.conversations.get(channel_id);
+
+        if (!conversation || !this.conversations.isListed(channel_id)) {
+            // a conversation we don't have yet, the leader tab loads the
+            // first page once for all the tabs
+            if (this.tabCoordinator.isLeader) {
+                this._loadConversations({ offset: 0, share: true });
+            }
+            return;
         }
+
+        const unreadCount = isSentMessage || isOpen ? 0 : (conversation.unread_count || 0) + 1;
+        this._updateConversationOrder({
+            id: channel_id,
+            last_message: this._formatMessageBody(last_message || message.body),
+            last_message_date: message.create_date,
+            last_message_author_id: message.author_id,
+            status: message.status,
+            is_sent: isSentMessage,
+            unread_count: unreadCount,
+            total_unread: unreadCount,
+        }, true, this.state.offset === 0);
+
+        this._appendOpenChatMessage(channel_id, message);
     }
 
-    _applySearchFilter(query) {
-        if (!query) {
-            this.state.filteredConversations = this.state.conversations;
-        } else {
-            const lowercaseQuery = query.toLowerCase();
-            this.state.filteredConversations = this.state.conversations.filter(conv => {
-                const name = (conv.partner_name || '').toLowerCase();
-                const phone = (conv.phone || '').toLowerCase();
-                const lastMessage = (conv.last_message || '').toLowerCase();
-                
-                return name.includes(lowercaseQuery) || 
-                       phone.includes(lowercaseQuery) || 
-                       lastMessage.includes(lowercaseQuery);
-            });
+    _onBusStatus({ channel_id, statuses }) {
+        const statusById = new Map(statuses.map(item => [item.message_id, item.status]));
+        if (this.state.selectedConversation?.id === channel_id) {
+            this.state.messages = this.state.messages.map(msg =>
+                statusById.has(msg.id) ? { ...msg, status: statusById.get(msg.id) } : msg
+            );
+        }
+    }
+
+    _onBusUnread({ channel_id, unread_count }) {
+        this.conversations.patch(channel_id, {
+            unread_count: unread_count,
+            total_unread: unread_count,
+        });
+    }
+
+    async _searchConversations() {
+        const query = this.state.searchQuery.trim();
+        this._cancelSearch();
+        if (!query) return;
+
+        const sequence = ++this._searchSequence;
+        this.state.searching = true;
+        this._searchRequest = this.rpc("/whatsapp/conversations", {
+            offset: this.state.searchOffset,
+            limit: this.state.limit,
+            search_term: query,
+        });
+        try {
+            const result = await this._searchRequest;
+            // a newer search was started meanwhile
+            if (sequence !== this._searchSequence) return;
+            if (result.error) {
+                this.state.error = result.error;
+                return;
+            }
+            // results share the stored rows, so updates reach both lists
+            this.state.filteredConversations = (result.conversations || []).map(
+                conv => this.conversations.upsert(this._prepareConversation(conv), { position: 'none' })
+            );
+            this.state.searchTotal = result.total_count || 0;
+            this.state.searchOffset = result.offset || 0;
+            this.state.error = null;
+            this._updatePaging();
+        } catch (error) {
+            if (sequence === this._searchSequence) {
+                console.error("Error searching conversations:", error);
+            }
+        } finally {
+            if (sequence === this._searchSequence) {
+                this.state.searching = false;
+                this._searchRequest = null;
+            }
+        }
+    }
+
+    _cancelSearch() {
+        this._debouncedSearch.cancel();
+        if (this._searchRequest) {
+            // invalidate the running request and abort it on the network
+            this._searchSequence++;
+            this._searchRequest.abort?.(false);
+            this._searchRequest = null;
+            this.state.searching = false;
         }
-        
-        //reset pagination when search changes
-        this.state.offset = 0;
-        this.state.currentPage = 1;
-        this._updatePaging();
     }
 
     _formatMessageBody(body) {
@@ -610,12 +875,78 @@ class WhatsAppChat extends Component {
                   .trim();
     }
 
+    /**
+     * Rows of the message list to mount, see VirtualWindow.
+     */
+    get messageWindow() {
+        const keys = this.state.messages.map(msg => msg.id);
+        this._messageRange = this.virtualMessages.compute(
+            keys, this.state.messageScrollTop, this.state.messageViewportHeight
+        );
+        return this._messageRange;
+    }
+
+    get visibleMessages() {
+        const { start, end } = this._messageRange || this.messageWindow;
+        return this.state.messages.slice(start, end);
+    }
+
+    _updateMessageWindow() {
+        const container = this.messageContainerRef.el;
+        if (!container) return;
+        const keys = this.state.messages.map(msg => msg.id);
+        const range = this.virtualMessages.compute(keys, container.scrollTop, container.clientHeight);
+        const current = this._messageRange;
+        // re-render only when other rows have to be mounted
+        if (!current || range.start !== current.start || range.end !== current.end) {
+            this.state.messageViewportHeight = container.clientHeight;
+            this.state.messageScrollTop = container.scrollTop;
+        }
+    }
+
+    _anchorScroll() {
+        const container = this.messageContainerRef.el;
+        if (!container) return;
+        const containerTop = container.getBoundingClientRect().top;
+        for (const row of container.querySelectorAll('.o_whatsapp_message_row[data-key]')) {
+            const top = row.getBoundingClientRect().top - containerTop;
+            if (top >= 0) {
+                this._scrollAnchor = { key: row.dataset.key, top };
+                return;
+            }
+        }
+    }
+
+    _onMessagesPatched() {
+        const container = this.messageContainerRef.el;
+        const list = container?.querySelector('.o_whatsapp_messages_list');
+        if (!list) return;
+        this.virtualMessages.measure(list);
+
+        if (this._scrollAnchor) {
+            const { key, top } = this._scrollAnchor;
+            this._scrollAnchor = null;
+            const row = list.querySelector(`:scope > [data-key="${key}"]`);
+            if (row) {
+                const containerTop = container.getBoundingClientRect().top;
+                container.scrollTop += row.getBoundingClientRect().top - containerTop - top;
+            }
+        } else if (this._stickToBottom) {
+            const behavior = this._stickToBottom;
+            this._stickToBottom = false;
+            container.scrollTo({ top: container.scrollHeight, behavior });
+        }
+    }
+
     _scrollToBottom(smooth = false) {
+        // mount the last messages, the scroll happens once they are patched
+        this._stickToBottom = smooth ? 'smooth' : 'auto';
+        this.state.messageScrollTop = Number.MAX_SAFE_INTEGER;
         if (this.messageContainerRef.el) {
             const container = this.messageContainerRef.el;
             const scrollOptions = smooth ? { behavior: 'smooth' } : undefined;
             
-            // use requestAnimationFrame to ensure DOM is updated
+            // nothing may have to be re-rendered, scroll right away as well
             requestAnimationFrame(() => {
                 container.scrollTo({
                     top: container.scrollHeight,
@@ -628,15 +959,23 @@ class WhatsAppChat extends Component {
     async _onLoadMoreMessages() {
         if (this.state.loading || !this.state.selectedConversation) return;
         
-        const newOffset = (this.state.messageOffset || 0) + (this.state.messageLimit || 50);
-        if (newOffset >= this.state.messageTotal) return;
-        
-        this.state.messageOffset = newOffset;
-        await this._loadMessages(this.state.selectedConversation);
+        if (!this.state.messageHasMore) return;
+
+        // continue before the oldest message shown, offsets shift when new messages arrive
+        const oldestId = Math.min(...this.state.messages.filter(msg => msg.id).map(msg => msg.id));
+        if (!Number.isFinite(oldestId)) return;
+
+        await this._loadMessages(this.state.selectedConversation, { beforeId: oldestId });
     }
 
     _onScroll(ev) {
         const container = ev.target;
+        if (!this._scrollFrame) {
+            this._scrollFrame = requestAnimationFrame(() => {
+                this._scrollFrame = null;
+                this._updateMessageWindow();
+            });
+        }
         // load more messages when scrolling near the top
         if (container.scrollTop <= 100 && !this.state.loading) {
             this._onLoadMoreMessages();
@@ -649,10 +988,14 @@ class WhatsAppChat extends Component {
 
     async _onClickConversation(conversation) {
         if (!conversation || !conversation.id) return;
+        this._reportActivity();
 
         // update selected conversation first
-        this.state.selectedConversation = { ...conversation };
+        this.state.selectedConversation = this.conversations.get(conversation.id) || { ...conversation };
         this.state.messages = []; // clear existing messages
+        this.state.messageHasMore = false;
+        this.state.messageScrollTop = 0;
+        this.virtualMessages.reset();
         
         // load messages
         await this._loadMessages(conversation);
@@ -663,40 +1006,11 @@ class WhatsAppChat extends Component {
                 channel_id: conversation.id
             });
 
-            // update the unread count in the conversation list while maintaining exact position
-            const updatedConversations = [...this.state.conversations];
-            const convIndex = updatedConversations.findIndex(conv => conv.id === conversation.id);
-            
-            if (convIndex !== -1) {
-                updatedConversations[convIndex] = {
-                    ...updatedConversations[convIndex],
-                    unread_count: 0,
-                    total_unread: 0
-                };
-            }
-
-            // update state while maintaining exact positions
-            this.state.conversations = updatedConversations;
-            
-            // update filtered conversations if search is active
-            if (this.state.searchQuery) {
-                const filteredConvs = [...this.state.filteredConversations];
-                const filteredIndex = filteredConvs.findIndex(conv => conv.id === conversation.id);
-                
-                if (filteredIndex !== -1) {
-                    filteredConvs[filteredIndex] = {
-                        ...filteredConvs[filteredIndex],
-                        unread_count: 0,
-                        total_unread: 0
-                    };
-                    this.state.filteredConversations = filteredConvs;
-                }
-            }
-
-            // update displayed conversations while maintaining exact positions
-            const start = this.state.offset;
-            const end = Math.min(start + this.state.limit, updatedConversations.length);
-            this.state.displayedConversations = updatedConversations.slice(start, end);
+            // update the unread count in place, search results share the same row
+            this.conversations.patch(conversation.id, {
+                unread_count: 0,
+                total_unread: 0
+            });
 
         } catch (error) {
             console.error("Error marking messages as read:", error);
@@ -730,56 +1044,41 @@ class WhatsAppChat extends Component {
         const files = Array.from(ev.target.files);
         if (!files.length) return;
 
-        try {
-            const formData = new FormData();
-            files.forEach(file => {
-                formData.append('files[]', file);
-            });
-            formData.append('channel_id', this.state.selectedConversation.id);
-            formData.append('csrf_token', odoo.csrf_token);
-            formData.append('file_type', files[0].type);
-
-            const response = await fetch('/whatsapp/upload_attachment', {
-                method: 'POST',
-                body: formData,
-                credentials: 'same-origin',
-            });
-
-            const result = await response.json();
-
-            if (result.error) {
-                this.state.error = result.error;
-            } else if (result.message) {
-                // add the new message to the UI
-                const newMessage = {
-                    ...result.message,
-                    body: this._formatMessageBody(result.message.body),
-                    direction: 'outbound',
-                };
-
-                // append new message at the end
-                this.state.messages = [...this.state.messages, newMessage];
-
-                // update the conversation in the list immediately
-                const attachmentType = this._getAttachmentPreviewText(files[0].type);
-                const updatedConv = {
-                    ...this.state.selectedConversation,
-                    last_message: attachmentType,
-                    last_message_date: result.message.create_date,
-                    unread_count: 0,
-                    total_unread: 0
-                };
-
-                // update conversations list while maintaining read status
-                this._updateConversationOrder(updatedConv, true);
+        // large files go through the resumable chunked upload, one message each
+        const smallFiles = files.filter(file => file.size <= this.chunkedUploadThreshold);
+        const largeFiles = files.filter(file => file.size > this.chunkedUploadThreshold);
 
-                // notify discuss about the new message
-                this.env.bus.trigger('discuss.message_created', {
-                    channelId: this.state.selectedConversation.id,
-                    messageId: result.message.id,
+        try {
+            if (smallFiles.length) {
+                const formData = new FormData();
+                for (const [index, file] of smallFiles.entries()) {
+                    formData.append('files[]', file);
+                    const thumbnail = await this._createVideoThumbnail(file);
+                    if (thumbnail) {
+                        formData.append(`thumbnail_${index}`, thumbnail, `${file.name}.thumbnail.jpg`);
+                    }
+                }
+                formData.append('channel_id', this.state.selectedConversation.id);
+                formData.append('csrf_token', odoo.csrf_token);
+                formData.append('file_type', smallFiles[0].type);
+
+                const response = await fetch('/whatsapp/upload_attachment', {
+                    method: 'POST',
+                    body: formData,
+                    credentials: 'same-origin',
                 });
 
-                this._scrollToBottom();
+                const result = await response.json();
+
+                if (result.error) {
+                    this.state.error = result.error;
+                } else if (result.message) {
+                    this._onAttachmentUploaded(result.message, smallFiles[0].type);
+                }
+            }
+            for (const file of largeFiles) {
+                const result = await this._uploadFileChunked(file, this.state.selectedConversation.id);
+                this._onAttachmentUploaded(result.message, file.type);
             }
         } catch (error) {
             this.state.error = "Failed to upload attachments";
@@ -790,6 +1089,134 @@ class WhatsAppChat extends Component {
         ev.target.value = '';
     }
 
+    _onAttachmentUploaded(message, mimeType) {
+        // add the new message to the UI
+        const newMessage = {
+            ...message,
+            body: this._formatMessageBody(message.body),
+            direction: 'outbound',
+        };
+
+        // append new message at the end, unless the bus already delivered it
+        if (!this.state.messages.some(msg => msg.id === message.id)) {
+            this.state.messages = [...this.state.messages, newMessage];
+        }
+
+        // update the conversation in the list immediately
+        const attachmentType = this._getAttachmentPreviewText(mimeType);
+        const updatedConv = {
+            ...this.state.selectedConversation,
+            last_message: attachmentType,
+            last_message_date: message.create_date,
+            unread_count: 0,
+            total_unread: 0
+        };
+
+        // update conversations list while maintaining read status
+        this._updateConversationOrder(updatedConv, true);
+
+        // notify discuss about the new message
+        this.env.bus.trigger('discuss.message_created', {
+            channelId: this.state.selectedConversation.id,
+            messageId: message.id,
+        });
+
+        this._scrollToBottom();
+    }
+
+    async _uploadFileChunked(file, channelId) {
+        const upload = await this.rpc('/whatsapp/upload/start', {
+            channel_id: channelId,
+            filename: file.name,
+            mimetype: file.type,
+            size: file.size,
+        });
+
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            try {
+                const formData = new FormData();
+                formData.append('upload_id', upload.upload_id);
+                formData.append('offset', offset);
+                formData.append('csrf_token', odoo.csrf_token);
+                formData.append('chunk', file.slice(offset, offset + upload.chunk_size), file.name);
+
+                const response = await fetch('/whatsapp/upload/chunk', {
+                    method: 'POST',
+                    body: formData,
+                    credentials: 'same-origin',
+                });
+                const result = await response.json();
+                if (result.error) {
+                    throw new Error(result.error);
+                }
+                offset = result.offset;
+                failures = 0;
+            } catch (error) {
+                if (++failures > this.chunkedUploadMaxRetries) {
+                    this.rpc('/whatsapp/upload/abort', { upload_id: upload.upload_id }).catch(() => {});
+                    throw error;
+                }
+                // resume from what the server actually received
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                const status = await this.rpc('/whatsapp/upload/status', { upload_id: upload.upload_id });
+                offset = status.offset;
+            }
+        }
+
+        const thumbnail = await this._createVideoThumbnail(file);
+        return this.rpc('/whatsapp/upload/finish', {
+            upload_id: upload.upload_id,
+            thumbnail: thumbnail ? await this._blobToBase64(thumbnail) : null,
+        });
+    }
+
+    /**
+     * Grab the first frame of a video file as a small JPEG poster, so that
+     * bubbles do not have to download the video to show a preview.
+     * Resolves to null for other files or when the browser cannot decode it.
+     */
+    _createVideoThumbnail(file) {
+        if (!file.type || !file.type.startsWith('video/')) {
+            return Promise.resolve(null);
+        }
+        return new Promise((resolve) => {
+            const url = URL.createObjectURL(file);
+            const video = document.createElement('video');
+            const done = (blob) => {
+                clearTimeout(timeout);
+                URL.revokeObjectURL(url);
+                resolve(blob);
+            };
+            const timeout = setTimeout(() => done(null), 5000);
+            video.muted = true;
+            video.preload = 'metadata';
+            video.onerror = () => done(null);
+            video.onloadeddata = () => {
+                video.currentTime = Math.min(0.1, video.duration || 0);
+            };
+            video.onseeked = () => {
+                const scale = Math.min(1, 256 / Math.max(video.videoWidth, video.videoHeight, 1));
+                const canvas = document.createElement('canvas');
+                canvas.width = Math.round(video.videoWidth * scale);
+                canvas.height = Math.round(video.videoHeight * scale);
+                canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+                canvas.toBlob(done, 'image/jpeg', 0.7);
+            };
+            video.src = url;
+        });
+    }
+
+    _blobToBase64(blob) {
+        return new Promise((resolve, reject) => {
+            const reader = new FileReader();
+            reader.onload = () => resolve(reader.result.split(',')[1]);
+            reader.onerror = reject;
+            reader.readAsDataURL(blob);
+        });
+    }
+
     _getAttachmentPreviewText(mimeType) {
         if (mimeType.startsWith('image/')) {
             return '📷 Photo';
@@ -879,7 +1306,10 @@ class WhatsAppChat extends Component {
                             direction: 'outbound',
                         };
 
-                        this.state.messages = [...this.state.messages, newMessage];
+                        // the bus may have delivered it already
+                        if (!this.state.messages.some(msg => msg.id === newMessage.id)) {
+                            this.state.messages = [...this.state.messages, newMessage];
+                        }
 
                         const updatedConv = {
                             ...this.state.selectedConversation,
@@ -1057,8 +1487,16 @@ class WhatsAppChat extends Component {
 
     _onSearch(event) {
         const query = event.target.value;
-        this.state.searchQuery = query;
-        this._applySearchFilter(query);
+        this.state.searchQuery = query.trim() ? query : '';
+        this.state.searchOffset = 0;
+        if (!this.state.searchQuery) {
+            this._cancelSearch();
+            this.state.filteredConversations = [];
+            this.state.searchTotal = 0;
+            this._updatePaging();
+            return;
+        }
+        this._debouncedSearch();
     }
 
     async onImageClick(attachment) {
@@ -1084,7 +1522,8 @@ class WhatsAppChat extends Component {
         this.dialogService.add(ImagePreviewDialog, {
             attachment: {
                 ...attachment,
-                url: `/web/image/${attachment.id}?unique=${Date.now()}`
+                // the full image is only fetched when the preview opens
+                url: this._getAttachmentPreviewUrl(attachment)
             },
             size: 'xl',
             technical: false,
@@ -1114,7 +1553,7 @@ class WhatsAppChat extends Component {
         this.dialogService.add(VideoPreviewDialog, {
             attachment: {
                 ...attachment,
-                url: `/web/content/${attachment.id}/datas`
+                url: this._getAttachmentPreviewUrl(attachment)
             },
             size: 'fullscreen',
             technical: false,
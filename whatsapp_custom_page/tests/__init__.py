@@ -0,0 +1,5 @@
+from . import test_whatsapp_bench
+from . import test_whatsapp_indexes
+from . import test_whatsapp_messages
+from . import test_whatsapp_routing
+from . import test_whatsapp_upload
@@ -0,0 +1,77 @@
+from odoo.tests.common import TransactionCase
+from odoo.tools import SQL
+
+
+class WhatsAppChatCommon(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.wa_account = cls.env['whatsapp.account'].create({
+            'name': 'Test Account',
+            'account_uid': 'test_account_uid',
+            'app_uid': 'test_app_uid',
+            'app_secret': 'test_app_secret',
+            'phone_uid': 'test_phone_uid',
+            'token': 'test_token',
+        })
+        cls.customer = cls.env['res.partner'].create({
+            'name': 'Test Customer',
+            'phone': '+32 470 00 00 01',
+        })
+        cls.channel = cls._create_whatsapp_channel('+32 470 00 00 01', cls.customer)
+
+    @classmethod
+    def _create_whatsapp_channel(cls, phone, partner):
+        channel = cls.env['discuss.channel'].create({
+            'name': f'{phone} - {partner.name}',
+            'channel_type': 'whatsapp',
+            'wa_account_id': cls.wa_account.id,
+            'whatsapp_number': phone,
+            'whatsapp_partner_id': partner.id,
+        })
+        # the agent follows the conversation with the customer
+        missing = (cls.env.user.partner_id | partner) - channel.channel_member_ids.partner_id
+        cls.env['discuss.channel.member'].create([
+            {'channel_id': channel.id, 'partner_id': member.id} for member in missing
+        ])
+        return channel
+
+    @classmethod
+    def _insert_messages(cls, channel, count, author=None, message_type='whatsapp_message'):
+        """Insert ``count`` messages in the channel with a single statement,
+        bypassing the ORM, to build large histories quickly"""
+        cls.env.flush_all()
+        cls.env.cr.execute("""
+            INSERT INTO mail_message (model, res_id, message_type, body, author_id,
+                                      date, create_date, write_date, create_uid, write_uid)
+                 SELECT 'discuss.channel', %(channel_id)s, %(message_type)s, 'Message ' || n, %(author_id)s,
+                        now() at time zone 'UTC', now() at time zone 'UTC', now() at time zone 'UTC',
+                        %(uid)s, %(uid)s
+                   FROM generate_series(1, %(count)s) n
+        """, {
+            'channel_id': channel.id,
+            'message_type': message_type,
+            'author_id': (author or channel.whatsapp_partner_id).id,
+            'uid': cls.env.uid,
+            'count': count,
+        })
+        cls.env.invalidate_all()
+
+    def _explain(self, query, params=None, analyze=False):
+        """Root node of the JSON plan of ``query``, a string or an ``SQL``"""
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+        if isinstance(query, SQL):
+            self.env.cr.execute(SQL(f'EXPLAIN ({options}) %s', query))
+        else:
+            self.env.cr.execute(f'EXPLAIN ({options}) {query}', params)
+        return self.env.cr.fetchone()[0][0]['Plan']
+
+    def _plan_nodes(self, plan):
+        """All the nodes of a JSON plan, depth first"""
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self._plan_nodes(child)
+
+    def _plan_indexes(self, plan):
+        return {node['Index Name'] for node in self._plan_nodes(plan) if node.get('Index Name')}
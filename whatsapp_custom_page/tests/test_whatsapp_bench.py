@@ -0,0 +1,90 @@
+import logging
+import time
+
+from odoo.tests import tagged
+
+from odoo.addons.whatsapp_custom_page.models.mail_message import LAST_MESSAGE_QUERY
+from odoo.addons.whatsapp_custom_page.tests.common import WhatsAppChatCommon
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('-standard', 'bench')
+class TestWhatsAppBench(WhatsAppChatCommon):
+    """Benchmarks, run with ``--test-tags bench``"""
+
+    def test_latest_message_flat_cost(self):
+        """The latest message lookup reads one row per channel, whatever the
+        size of the history"""
+        partners = self.env['res.partner'].create([{'name': f'Bench Customer {i}'} for i in range(20)])
+        channels = self.channel.browse([
+            self._create_whatsapp_channel(f'+32 470 10 00 {i:02d}', partner).id
+            for i, partner in enumerate(partners)
+        ])
+        MailMessage = self.env['mail.message']
+
+        rows_read = {}
+        history = 0
+        for target in (10, 1000, 10000):
+            for channel in channels:
+                self._insert_messages(channel, target - history)
+            history = target
+            self.env.cr.execute('ANALYZE mail_message')
+
+            plan = self._explain(LAST_MESSAGE_QUERY, [channels.ids], analyze=True)
+            # rows returned or discarded by the scans of mail_message
+            rows_read[target] = sum(
+                (node['Actual Rows'] + node.get('Rows Removed by Filter', 0)) * node['Actual Loops']
+                for node in self._plan_nodes(plan)
+                if node.get('Relation Name') == 'mail_message'
+            )
+
+            start = time.perf_counter()
+            for _i in range(10):
+                last_message_ids = MailMessage._whatsapp_get_last_message_ids(channels.ids)
+            elapsed = (time.perf_counter() - start) / 10
+            self.assertEqual(set(last_message_ids), set(channels.ids))
+            _logger.info(
+                "latest message of %s channels with %s messages each: %.2f ms, %s rows read",
+                len(channels), target, elapsed * 1000, rows_read[target],
+            )
+
+        self.assertEqual(set(rows_read.values()), {len(channels)})
+
+    def test_receipts_batch(self):
+        """A webhook payload of 10k receipts costs a bounded number of
+        queries instead of a few per receipt"""
+        self._insert_messages(self.channel, 10000, author=self.env.user.partner_id)
+        mail_messages = self.env['mail.message'].search([
+            ('model', '=', 'discuss.channel'), ('res_id', '=', self.channel.id),
+        ], order='id')
+        official_messages = self.env['whatsapp.message'].create([{
+            'mobile_number': self.channel.whatsapp_phone,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': f'wamid.bench.{index}',
+            'wa_account_id': self.wa_account.id,
+            'mail_message_id': message.id,
+        } for index, message in enumerate(mail_messages)])
+        statuses = [{
+            'id': message.msg_uid,
+            'status': 'read' if index % 3 else 'delivered',
+        } for index, message in enumerate(official_messages)]
+        # late delivered receipts of read messages
+        statuses += [{'id': message.msg_uid, 'status': 'delivered'} for message in official_messages[1::3]]
+        self.env.flush_all()
+        self.env.invalidate_all()
+
+        start_queries = self.cr.sql_log_count
+        start = time.perf_counter()
+        self.env['whatsapp.message']._process_statuses({'statuses': statuses})
+        self.env.flush_all()
+        elapsed = time.perf_counter() - start
+        queries = self.cr.sql_log_count - start_queries
+        _logger.info("%s receipts applied: %.2f s, %s queries", len(statuses), elapsed, queries)
+
+        self.assertLess(queries, len(statuses) / 50)
+        self.assertEqual(
+            official_messages.mapped('state'),
+            ['read' if index % 3 else 'delivered' for index in range(len(official_messages))],
+        )
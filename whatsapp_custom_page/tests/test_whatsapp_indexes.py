@@ -0,0 +1,44 @@
+from odoo.osv import expression
+
+from odoo.addons.whatsapp_custom_page.models.mail_message import LAST_MESSAGE_QUERY
+from odoo.addons.whatsapp_custom_page.tests.common import WhatsAppChatCommon
+
+MESSAGE_INDEX = 'mail_message_whatsapp_res_id_id_index'
+
+
+class TestWhatsAppIndexes(WhatsAppChatCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # a history mostly made of other messages, so that the generic
+        # (model, res_id) indexes of mail are clearly worse than ours
+        cls._insert_messages(cls.channel, 200)
+        cls._insert_messages(cls.channel, 2000, author=cls.env.user.partner_id, message_type='comment')
+
+    def setUp(self):
+        super().setUp()
+        self.env.cr.execute('ANALYZE mail_message')
+        # the test tables are small, make sure the planner does not fall back
+        # to sequential scans that would hide which index is picked
+        self.env.cr.execute('SET LOCAL enable_seqscan = off')
+        self.addCleanup(self.env.cr.execute, 'RESET enable_seqscan')
+
+    def _explain_messages_page(self, extra_domain=None):
+        MailMessage = self.env['mail.message']
+        domain = MailMessage._whatsapp_get_channel_domain(self.channel.id)
+        # same search as /whatsapp/messages, one extra row for has_more
+        query = MailMessage._search(expression.AND([domain, extra_domain or []]), order='id desc', limit=51)
+        return self._explain(query.select())
+
+    def test_messages_page_uses_partial_index(self):
+        self.assertIn(MESSAGE_INDEX, self._plan_indexes(self._explain_messages_page()))
+
+    def test_messages_keyset_page_uses_partial_index(self):
+        before_id = max(self.env['mail.message']._whatsapp_get_last_message_ids([self.channel.id]).values())
+        plan = self._explain_messages_page([('id', '<', before_id)])
+        self.assertIn(MESSAGE_INDEX, self._plan_indexes(plan))
+
+    def test_latest_message_uses_partial_index(self):
+        plan = self._explain(LAST_MESSAGE_QUERY, [[self.channel.id]])
+        self.assertIn(MESSAGE_INDEX, self._plan_indexes(plan))
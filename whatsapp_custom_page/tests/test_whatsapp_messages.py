@@ -0,0 +1,156 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.addons.whatsapp_custom_page.tests.common import WhatsAppChatCommon
+
+
+class TestWhatsAppMessages(WhatsAppChatCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        agent = cls.env.user.partner_id
+        cls.messages = cls.env['mail.message'].create([{
+            'body': f'Message {i}',
+            'message_type': 'whatsapp_message',
+            'model': 'discuss.channel',
+            'res_id': cls.channel.id,
+            'author_id': (agent if i % 2 else cls.customer).id,
+        } for i in range(50)])
+        # outbound messages take their status from the official message
+        outbound = cls.messages.filtered(lambda m: m.author_id == agent)
+        official_messages = cls.env['whatsapp.message'].create([{
+            'mobile_number': cls.channel.whatsapp_phone,
+            'message_type': 'outbound',
+            'state': 'delivered',
+            'wa_account_id': cls.wa_account.id,
+            'mail_message_id': message.id,
+        } for message in outbound])
+        for message, official_message in zip(outbound, official_messages):
+            message.official_whatsapp_message_id = official_message
+
+    def _get_page(self, size):
+        return self.messages.browse(self.messages.sorted('id', reverse=True)[:size].ids)
+
+    def _count_queries(self, func):
+        self.env.flush_all()
+        self.env.invalidate_all()
+        start = self.cr.sql_log_count
+        func()
+        return self.cr.sql_log_count - start
+
+    def test_format_messages_query_count(self):
+        """Formatting a page of messages costs the same number of queries
+        whatever its size, statuses included"""
+        expected = self._count_queries(lambda: self._get_page(10)._whatsapp_format_messages())
+
+        page = self._get_page(50)
+        self.env.invalidate_all()
+        with self.assertQueryCount(expected):
+            result = page._whatsapp_format_messages()
+
+        self.assertEqual(len(result), 50)
+        statuses = {values['status'] for values in result if values['author_id'] == self.env.user.partner_id.id}
+        self.assertEqual(statuses, {'delivered'})
+
+    def test_status_map_query_count(self):
+        expected = self._count_queries(lambda: self._get_page(10)._whatsapp_get_status_map())
+
+        page = self._get_page(50)
+        self.env.invalidate_all()
+        with self.assertQueryCount(expected):
+            status_map = page._whatsapp_get_status_map()
+
+        self.assertEqual(set(status_map), set(page.ids))
+
+    def test_send_bulk_batches_channel_updates(self):
+        """A bulk send writes each summary once and sends a single bus batch"""
+        channels = self.channel | self.env['discuss.channel'].concat(*(
+            self._create_whatsapp_channel(f'+32 470 00 01 {i:02d}', self.customer.copy())
+            for i in range(4)
+        ))
+        channels.write({'whatsapp_window_expiry': fields.Datetime.now() + timedelta(hours=1)})
+
+        Bus = type(self.env['bus.bus'])
+        with patch.object(Bus, '_sendmany', autospec=True) as sendmany:
+            messages = channels._whatsapp_send_bulk(body='Hello')
+
+        self.assertEqual(len(messages), 5)
+        message_batches = [
+            [payload for _partner, notification_type, payload in call.args[1]
+             if notification_type == 'whatsapp_custom_page/message']
+            for call in sendmany.call_args_list
+        ]
+        message_batches = [batch for batch in message_batches if batch]
+        self.assertEqual(len(message_batches), 1)
+        notified = {payload['message']['id'] for payload in message_batches[0]}
+        self.assertEqual(notified, set(messages.ids))
+        self.assertEqual(channels.whatsapp_last_message_id, messages)
+        self.assertTrue(all(message.official_whatsapp_message_id for message in messages))
+        self.assertEqual(messages.official_whatsapp_message_id.mail_message_id, messages)
+
+    def test_phone_search_last_digits(self):
+        Channel = self.env['discuss.channel']
+        other = self._create_whatsapp_channel('+32 470 01 23 45', self.customer.copy())
+        for term in ('0001', '470 00 00 01', '+32 470'):
+            self.assertIn(self.channel, Channel.search(Channel._whatsapp_phone_search_domain(term)), term)
+        # leading zeros are searched as typed
+        self.assertNotIn(other, Channel.search(Channel._whatsapp_phone_search_domain('0001')))
+        self.assertFalse(Channel.search(Channel._whatsapp_phone_search_domain('9999')))
+        self.assertEqual(Channel._whatsapp_phone_search_domain('Test'), [(0, '=', 1)])
+
+    def test_search_channels_busy_conversation(self):
+        """A conversation with many matches does not hide the other ones"""
+        other = self._create_whatsapp_channel('+32 470 00 02 00', self.customer.copy())
+        self.env['mail.message'].create([{
+            'body': f'Invoice reminder {i}',
+            'message_type': 'whatsapp_message',
+            'model': 'discuss.channel',
+            'res_id': channel.id,
+            'author_id': self.customer.id,
+        } for i, channel in enumerate([self.channel] * 60 + [other])])
+
+        channel_ids = self.env['mail.message']._whatsapp_search_channels('invoice', (self.channel | other).ids)
+        self.assertCountEqual(channel_ids, (self.channel | other).ids)
+
+    def test_recompute_last_inbound_linked_partner(self):
+        """The backfill only counts the messages of the linked customer, as
+        the live code does"""
+        customer = self.customer.copy()
+        channel = self._create_whatsapp_channel('+32 470 00 03 00', customer)
+        self._insert_messages(channel, 3, author=self.env['res.partner'].create({'name': 'Someone Else'}))
+        channel._whatsapp_recompute_last_inbound()
+        self.assertFalse(channel.whatsapp_last_inbound_date)
+
+        self._insert_messages(channel, 1, author=customer)
+        channel._whatsapp_recompute_last_inbound()
+        self.assertTrue(channel._whatsapp_window_open())
+
+    def test_phone_from_whatsapp_number(self):
+        channel = self._create_whatsapp_channel('0032 470 00 04 00', self.customer.copy())
+        channel.name = 'Renamed conversation'
+        self.assertEqual(channel.whatsapp_phone, '+32470000400')
+        Channel = self.env['discuss.channel']
+        self.assertEqual(Channel._whatsapp_find_channels(['+32 (470) 00.04.00']), channel)
+        self.assertFalse(Channel._whatsapp_find_channels(['+32 470 00 04 00'], [('id', '!=', channel.id)]))
+
+    def test_receipts_sent_then_failed(self):
+        """A failure received after the sent receipt of the same payload is
+        applied, with its details"""
+        official_message = self.env['whatsapp.message'].create({
+            'mobile_number': self.channel.whatsapp_phone,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': 'wamid.failed',
+            'wa_account_id': self.wa_account.id,
+            'mail_message_id': self.messages[1].id,
+        })
+        self.env['whatsapp.message']._process_statuses({'statuses': [
+            {'id': 'wamid.failed', 'status': 'sent'},
+            {'id': 'wamid.failed', 'status': 'failed', 'errors': [{
+                'code': 131047, 'title': 'Re-engagement message', 'message': 'Re-engagement message',
+            }]},
+        ]})
+        self.assertEqual(official_message.state, 'error')
+        self.assertIn('131047', official_message.error_message)
@@ -0,0 +1,11 @@
+from odoo.addons.whatsapp_custom_page.tests.common import WhatsAppChatCommon
+
+
+class TestWhatsAppRouting(WhatsAppChatCommon):
+
+    def test_route_all_weights_zero(self):
+        """Accounts kept for their pinned conversations still route new ones
+        when no account has a weight"""
+        accounts = self.env['whatsapp.account'].search([('active', '=', True)])
+        accounts.write({'whatsapp_routing_weight': 0})
+        self.assertIn(self.env['whatsapp.account']._whatsapp_route(), accounts)
@@ -0,0 +1,68 @@
+import io
+from unittest.mock import MagicMock, patch
+
+from odoo.exceptions import UserError
+from odoo.addons.whatsapp.tools.whatsapp_api import WhatsAppApi
+from odoo.addons.whatsapp_custom_page.tests.common import WhatsAppChatCommon
+
+
+class TestWhatsAppUpload(WhatsAppChatCommon):
+
+    def setUp(self):
+        super().setUp()
+        self.Attachment = self.env['ir.attachment']
+        self.upload_id = self.Attachment._whatsapp_upload_start(
+            'discuss.channel', self.channel.id, 'file.bin', 'application/octet-stream', 10,
+        )
+        self.addCleanup(self.Attachment._whatsapp_upload_abort, self.upload_id)
+
+    def _send(self, offset, data):
+        return self.Attachment._whatsapp_upload_chunk(self.upload_id, offset, io.BytesIO(data))
+
+    def test_chunk_sent_again(self):
+        """A chunk sent again after a lost response is stored once"""
+        self.assertEqual(self._send(0, b'01234'), 5)
+        self.assertEqual(self._send(0, b'01234'), 5)
+        self.assertEqual(self._send(5, b'56789'), 10)
+        attachment = self.Attachment._whatsapp_upload_finish(self.upload_id)
+        self.assertEqual(attachment.raw, b'0123456789')
+
+    def test_chunk_past_received_data(self):
+        self.assertEqual(self._send(0, b'01234'), 5)
+        self.assertEqual(self._send(7, b'789'), 5)
+
+    def test_chunk_larger_than_announced(self):
+        self.assertEqual(self._send(0, b'01234'), 5)
+        with self.assertRaises(UserError):
+            self._send(5, b'56789ABC')
+        with self.assertRaises(UserError):
+            self.Attachment._whatsapp_upload_info(self.upload_id)
+
+    def test_announced_size_bounds(self):
+        for size in (0, -1, 200 * 1024 * 1024):
+            with self.assertRaises(UserError):
+                self.Attachment._whatsapp_upload_start(
+                    'discuss.channel', self.channel.id, 'file.bin', 'application/octet-stream', size,
+                )
+
+
+class TestWhatsAppMediaUpload(WhatsAppChatCommon):
+
+    def test_media_uploaded_once(self):
+        """The same content is streamed from the filestore and uploaded once
+        per account"""
+        attachments = self.env['ir.attachment'].create([{
+            'name': f'photo{i}.jpg',
+            'raw': b'same picture',
+            'mimetype': 'image/jpeg',
+        } for i in range(2)])
+        response = MagicMock()
+        response.json.return_value = {'id': 'media-1'}
+        with patch.object(WhatsAppApi, '_WhatsAppApi__api_requests', return_value=response) as api_requests:
+            media_ids = [WhatsAppApi(self.wa_account)._upload_whatsapp_document(attachment) for attachment in attachments]
+
+        self.assertEqual(media_ids, ['media-1', 'media-1'])
+        self.assertEqual(api_requests.call_count, 1)
+        body = api_requests.call_args.kwargs['data']
+        self.assertIn(b'same picture', b''.join(body))
+        self.assertEqual(len(b''.join(body)), len(body))